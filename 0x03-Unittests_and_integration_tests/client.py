@@ -1,28 +1,45 @@
 #!/usr/bin/env python3
 """A github org client
 """
+from concurrent.futures import ThreadPoolExecutor
+import threading
 from typing import (
     List,
     Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
 )
 
 from utils import (
+    MAX_WORKERS,
+    extract_many,
     get_json,
-    access_nested_map,
-    memoize,
+    iter_json_pages,
+    iter_json_stream,
+    compile_path,
+    synchronized_memoize,
 )
 
+CACHE_TTL = 300.0
+_license_key = compile_path(("license", "key"))
+# Fields kept per repo when streaming, enough for public_repos/has_license
+REPO_FIELDS = (("name",), ("license", "key"))
+
 
 class GithubOrgClient:
     """A Githib org client
     """
     ORG_URL = "https://api.github.com/orgs/{org}"
 
-    def __init__(self, org_name: str) -> None:
+    def __init__(self, org_name: str,
+                 max_workers: int = MAX_WORKERS) -> None:
         """Init method of GithubOrgClient"""
         self._org_name = org_name
+        self.max_workers = max_workers
 
-    @memoize
+    @synchronized_memoize(ttl=CACHE_TTL)
     def org(self) -> Dict:
         """Memoize org"""
         return get_json(self.ORG_URL.format(org=self._org_name))
@@ -32,27 +49,194 @@ class GithubOrgClient:
         """Public repos URL"""
         return self.org["repos_url"]
 
-    @memoize
-    def repos_payload(self) -> Dict:
-        """Memoize repos payload"""
-        return get_json(self._public_repos_url)
+    @synchronized_memoize(ttl=CACHE_TTL)
+    def repos_payload(self) -> List[Dict]:
+        """Memoize repos payload, across every page"""
+        return list(iter_json_pages(self._public_repos_url,
+                                    max_workers=self.max_workers))
 
-    def public_repos(self, license: str = None) -> List[str]:
-        """Public repos"""
-        json_payload = self.repos_payload
-        public_repos = [
-            repo["name"] for repo in json_payload
-            if license is None or self.has_license(repo, license)
-        ]
+    def invalidate(self) -> None:
+        """Drop the memoized org and repos so the next access refetches"""
+        del self.org
+        del self.repos_payload
+
+    def _stream_repos(self) -> Iterator[Dict]:
+        """Yield repos as pages arrive, memoizing the full payload once
+        the last page is read"""
+        if GithubOrgClient.repos_payload.is_cached(self):
+            yield from self.repos_payload
+            return
+        repos = []
+        for repo in iter_json_pages(self._public_repos_url,
+                                    max_workers=self.max_workers):
+            repos.append(repo)
+            yield repo
+        self.repos_payload = repos
 
-        return public_repos
+    def iter_public_repos(self, license: str = None,
+                          stream: bool = False) -> Iterator[str]:
+        """Public repos, yielded while later pages are still loading.
+        With `stream`, page bodies are parsed incrementally and only the
+        name and license key of each repo are kept, so memory stays at
+        one repo; nothing is memoized in that mode.
+        """
+        if stream:
+            repos = iter_json_stream(self._public_repos_url,
+                                     fields=REPO_FIELDS)
+        else:
+            repos = self._stream_repos()
+        for repo in repos:
+            if license is None or self.has_license(repo, license):
+                yield repo["name"]
+
+    def public_repos(self, license: str = None,
+                     stream: bool = False) -> List[str]:
+        """Public repos"""
+        return list(self.iter_public_repos(license, stream=stream))
 
     @staticmethod
     def has_license(repo: Dict[str, Dict], license_key: str) -> bool:
         """Static: has_license"""
         assert license_key is not None, "license_key cannot be None"
         try:
-            has_license = access_nested_map(repo, ("license", "key")) == license_key
+            has_license = _license_key(repo) == license_key
         except KeyError:
             return False
         return has_license
+
+
+class OrgFetchError(Exception):
+    """Raised by GithubOrgBatchClient once the orgs that could be fetched
+    are indexed; `failures` maps each other org to its error.
+    """
+
+    def __init__(self, failures: Dict[str, Exception]) -> None:
+        """Init method of OrgFetchError"""
+        super().__init__("could not fetch orgs: {}".format(
+            ", ".join(sorted(failures))))
+        self.failures = failures
+
+
+class GithubOrgBatchClient:
+    """Public repos of many orgs, indexed by license key.
+    Orgs are fetched concurrently, each through its own GithubOrgClient,
+    and their repos are folded into an inverted index of
+    license key -> org -> repo names, so a license query costs the size
+    of its answer rather than a scan of the org's repos.
+    Each org's pages share the MAX_WORKERS connections of the session
+    with the other orgs in flight, so `max_workers` orgs fetch at most
+    MAX_WORKERS // max_workers pages at once each.
+    """
+
+    def __init__(self, org_names: Iterable[str] = (),
+                 max_workers: int = MAX_WORKERS) -> None:
+        """Init method of GithubOrgBatchClient"""
+        self.max_workers = max_workers
+        self._page_workers = max(1, MAX_WORKERS // max_workers)
+        self._clients: Dict[str, GithubOrgClient] = {}
+        self._repos: Dict[str, List[str]] = {}
+        self._index: Dict[str, Dict[str, List[str]]] = {}
+        self._org_licenses: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.add_orgs(org_names)
+
+    @property
+    def orgs(self) -> List[str]:
+        """Names of the indexed orgs"""
+        with self._lock:
+            return list(self._clients)
+
+    def add_orgs(self, org_names: Iterable[str]) -> None:
+        """Fetch and index orgs that are not indexed yet.
+        Orgs that fail to fetch are not added; OrgFetchError lists them
+        after the others are indexed.
+        """
+        with self._lock:
+            new_names = [name for name in dict.fromkeys(org_names)
+                         if name not in self._clients]
+        self._load({name: GithubOrgClient(name,
+                                          max_workers=self._page_workers)
+                    for name in new_names})
+
+    def refresh(self, org_names: Optional[Iterable[str]] = None) -> None:
+        """Refetch orgs concurrently and reindex only them.
+        An org that fails to fetch keeps its previous index entries;
+        OrgFetchError lists such orgs after the others are reindexed.
+        Parameters
+        ----------
+        org_names: Iterable[str]
+            orgs to refresh, all indexed orgs by default
+        """
+        with self._lock:
+            names = list(self._clients if org_names is None else org_names)
+            clients = {name: self._clients[name] for name in names}
+        for client in clients.values():
+            client.invalidate()
+        self._load(clients)
+
+    def _load(self, clients: Dict[str, GithubOrgClient]) -> None:
+        """Fetch the repos of each client concurrently, then register and
+        index every org that was fetched"""
+        if not clients:
+            return
+        payloads = {}
+        failures = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                name: executor.submit(lambda client: client.repos_payload,
+                                      client)
+                for name, client in clients.items()
+            }
+            for name, future in futures.items():
+                try:
+                    payloads[name] = future.result()
+                except Exception as error:
+                    failures[name] = error
+        with self._lock:
+            for name, payload in payloads.items():
+                self._clients[name] = clients[name]
+                self._reindex(name, payload)
+        if failures:
+            raise OrgFetchError(failures)
+
+    def _reindex(self, org_name: str, repos_payload: List[Dict]) -> None:
+        """Replace the index entries of one org"""
+        for license_key in self._org_licenses.pop(org_name, ()):
+            by_org = self._index[license_key]
+            del by_org[org_name]
+            if not by_org:
+                del self._index[license_key]
+
+        names = []
+        by_license: Dict[str, List[str]] = {}
+        for name, license_key in extract_many(
+                repos_payload, (("name",), ("license", "key"))):
+            names.append(name)
+            if license_key is not None:
+                by_license.setdefault(license_key, []).append(name)
+
+        self._repos[org_name] = names
+        self._org_licenses[org_name] = set(by_license)
+        for license_key, license_names in by_license.items():
+            self._index.setdefault(license_key, {})[org_name] = license_names
+
+    def public_repos(self, org_name: str,
+                     license: str = None) -> List[str]:
+        """Public repos of an indexed org, optionally with one license"""
+        with self._lock:
+            if org_name not in self._repos:
+                raise KeyError(org_name)
+            if license is None:
+                return list(self._repos[org_name])
+            return list(self._index.get(license, {}).get(org_name, ()))
+
+    def repos_with_license(self, license: str) -> Dict[str, List[str]]:
+        """Repos with a license across every indexed org, keyed by org"""
+        with self._lock:
+            return {org_name: list(names) for org_name, names
+                    in self._index.get(license, {}).items()}
+
+    def licenses(self) -> List[str]:
+        """License keys used by at least one indexed repo"""
+        with self._lock:
+            return sorted(self._index)
@@ -1,4 +1,10 @@
 #!/usr/bin/env python3
+"""Test fixtures for the github org client tests.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple, Union
 
 TEST_PAYLOAD = [
   (
@@ -948,3 +954,77 @@ TEST_PAYLOAD = [
     ['dagger', 'kratu', 'traceur-compiler', 'firmata.py'],
   )
 ]
+
+
+Route = Union[Any, Callable[["StubHandler"], Tuple[int, Dict, Any]]]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Request handler serving the routes of a StubServer."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        """Serve a JSON payload, or a (status, headers, payload) route."""
+        server = self.server.stub
+        server.record(self)
+        route = server.routes.get(self.path.split("?")[0])
+        if route is None:
+            status, headers, payload = 404, {}, {"message": "Not Found"}
+        elif callable(route):
+            status, headers, payload = route(self)
+        else:
+            status, headers, payload = 200, {}, route
+
+        body = b"" if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Keep test output quiet."""
+
+
+class StubServer:
+    """Local HTTP/1.1 server with keep-alive serving canned JSON.
+    Routes map a path to a payload, or to a callable taking the handler
+    and returning (status, headers, payload).
+    """
+
+    def __init__(self, routes: Dict[str, Route] = None) -> None:
+        """Init method of StubServer"""
+        self.routes = dict(routes or {})
+        self.requests: List[Tuple[str, int, Dict[str, str]]] = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.stub = self
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            daemon=True)
+
+    def record(self, handler: StubHandler) -> None:
+        """Record the path, client port and headers of a request"""
+        with self._lock:
+            self.requests.append(
+                (handler.path, handler.client_address[1],
+                 dict(handler.headers)))
+
+    def url(self, path: str) -> str:
+        """Absolute URL of a path on this server"""
+        host, port = self._httpd.server_address[:2]
+        return "http://{}:{}{}".format(host, port, path)
+
+    def start(self) -> "StubServer":
+        """Start serving in a background thread"""
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
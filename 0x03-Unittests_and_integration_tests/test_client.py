@@ -6,11 +6,18 @@ This module contains comprehensive unit tests for the client module,
 specifically testing the GithubOrgClient class.
 """
 
+import threading
 import unittest
 from unittest.mock import patch, Mock, PropertyMock
 from parameterized import parameterized, parameterized_class
-from client import GithubOrgClient
-from fixtures import TEST_PAYLOAD
+import client as client_module
+from client import (
+    GithubOrgBatchClient,
+    GithubOrgClient,
+    OrgFetchError,
+    REPO_FIELDS,
+)
+from fixtures import TEST_PAYLOAD, StubServer
 
 
 class TestGithubOrgClient(unittest.TestCase):
@@ -33,6 +40,17 @@ class TestGithubOrgClient(unittest.TestCase):
         mock_get_json.assert_called_once_with(expected_url)
         self.assertEqual(result, expected_org_data)
 
+    @patch('client.get_json')
+    def test_invalidate(self, mock_get_json):
+        """Test that invalidate makes the next org access refetch."""
+        mock_get_json.return_value = {"login": "google"}
+        client = GithubOrgClient("google")
+        client.org
+        client.org
+        client.invalidate()
+        client.org
+        self.assertEqual(mock_get_json.call_count, 2)
+
     def test_public_repos_url(self):
         """Test that _public_repos_url returns the expected repos URL."""
         known_payload = {
@@ -52,15 +70,15 @@ class TestGithubOrgClient(unittest.TestCase):
             result = client._public_repos_url
             self.assertEqual(result, known_payload["repos_url"])
 
-    @patch('client.get_json')
-    def test_public_repos(self, mock_get_json):
+    @patch('client.iter_json_pages')
+    def test_public_repos(self, mock_iter_json_pages):
         """Test that public_repos returns the expected repo names."""
         test_payload = [
             {"name": "repo1", "license": {"key": "mit"}},
             {"name": "repo2", "license": {"key": "apache-2.0"}},
             {"name": "repo3", "license": None},
         ]
-        mock_get_json.return_value = test_payload
+        mock_iter_json_pages.return_value = iter(test_payload)
         test_repos_url = "https://api.github.com/orgs/test-org/repos"
 
         with patch.object(
@@ -76,7 +94,8 @@ class TestGithubOrgClient(unittest.TestCase):
             expected_repos = ["repo1", "repo2", "repo3"]
             self.assertEqual(result, expected_repos)
             mock_public_repos_url.assert_called_once()
-            mock_get_json.assert_called_once_with(test_repos_url)
+            mock_iter_json_pages.assert_called_once_with(
+                test_repos_url, max_workers=client_module.MAX_WORKERS)
 
     @parameterized.expand([
         ({"license": {"key": "my_license"}}, "my_license", True),
@@ -98,9 +117,10 @@ class TestIntegrationGithubOrgClient(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        """Set up patching of requests.get with proper fixtures."""
-        def requests_get_side_effect(url):
+        """Set up patching of the session's get with proper fixtures."""
+        def requests_get_side_effect(url, **kwargs):
             mock_response = Mock()
+            mock_response.links = {}
             if url.endswith("/orgs/google"):
                 mock_response.json.return_value = cls.org_payload
             elif "/repos" in url:
@@ -109,13 +129,13 @@ class TestIntegrationGithubOrgClient(unittest.TestCase):
                 mock_response.json.return_value = {}
             return mock_response
 
-        cls.get_patcher = patch('requests.get')
+        cls.get_patcher = patch('requests.Session.get')
         cls.mock_requests_get = cls.get_patcher.start()
         cls.mock_requests_get.side_effect = requests_get_side_effect
 
     @classmethod
     def tearDownClass(cls):
-        """Stop patching requests.get."""
+        """Stop patching the session's get."""
         cls.get_patcher.stop()
 
     def test_public_repos(self):
@@ -131,5 +151,183 @@ class TestIntegrationGithubOrgClient(unittest.TestCase):
         self.assertEqual(result, self.apache2_repos)
 
 
+class TestPaginatedGithubOrgClient(unittest.TestCase):
+    """Test GithubOrgClient against a paginated stub GitHub API."""
+
+    PAGES = 3
+
+    def setUp(self):
+        """Serve an org whose repos span three Link-header pages."""
+        self.last_page_gate = threading.Event()
+        self.last_page_gate.set()
+        self.server = StubServer().start()
+        repos_url = self.server.url("/orgs/paged/repos")
+
+        def repos_page(handler):
+            page = int(handler.path.partition("page=")[2] or 1)
+            if page == self.PAGES:
+                self.last_page_gate.wait(5)
+            links = []
+            if page < self.PAGES:
+                links.append('<{}?page={}>; rel="next"'.format(
+                    repos_url, page + 1))
+            if page == 1:
+                links.append('<{}?page={}>; rel="last"'.format(
+                    repos_url, self.PAGES))
+            headers = {"Link": ", ".join(links)} if links else {}
+            license_key = "mit" if page % 2 else "apache-2.0"
+            payload = [
+                {"name": "repo{}-{}".format(page, i),
+                 "owner": {"login": "paged", "id": page},
+                 "license": {"key": license_key}}
+                for i in range(2)
+            ]
+            return 200, headers, payload
+
+        self.server.routes["/orgs/paged"] = {"repos_url": repos_url}
+        self.server.routes["/orgs/paged/repos"] = repos_page
+        self.url_patcher = patch.object(
+            GithubOrgClient, "ORG_URL", self.server.url("/orgs/{org}"))
+        self.url_patcher.start()
+
+    def tearDown(self):
+        """Stop patching and release the stub server."""
+        self.last_page_gate.set()
+        self.url_patcher.stop()
+        self.server.stop()
+
+    def test_public_repos_reads_every_page(self):
+        """Test that repos from every page are returned in order."""
+        client = GithubOrgClient("paged")
+        expected = ["repo{}-{}".format(page, i)
+                    for page in range(1, self.PAGES + 1) for i in range(2)]
+        self.assertEqual(client.public_repos(), expected)
+        self.assertEqual(client.public_repos(license="apache-2.0"),
+                         ["repo2-0", "repo2-1"])
+
+    def test_iter_public_repos_streams_before_last_page(self):
+        """Test that names are yielded before the last page arrives."""
+        self.last_page_gate.clear()
+        client = GithubOrgClient("paged")
+        repos = client.iter_public_repos()
+        self.assertEqual(next(repos), "repo1-0")
+        self.last_page_gate.set()
+        self.assertEqual(len(list(repos)), 2 * self.PAGES - 1)
+        self.assertEqual(len(client.repos_payload), 2 * self.PAGES)
+
+    def test_public_repos_stream(self):
+        """Test that streaming mode matches the buffered results and
+        keeps only the projected fields."""
+        client = GithubOrgClient("paged")
+        self.assertEqual(client.public_repos(stream=True),
+                         client.public_repos())
+        self.assertEqual(client.public_repos(license="apache-2.0",
+                                             stream=True),
+                         ["repo2-0", "repo2-1"])
+        with patch("client.iter_json_stream",
+                   wraps=client_module.iter_json_stream) as mock_stream:
+            client.public_repos(stream=True)
+        mock_stream.assert_called_once_with(client._public_repos_url,
+                                            fields=REPO_FIELDS)
+
+
+class TestGithubOrgBatchClient(unittest.TestCase):
+    """Test GithubOrgBatchClient against a stub GitHub API."""
+
+    REPOS = {
+        "alpha": [("a1", "mit"), ("a2", "apache-2.0"), ("a3", None)],
+        "beta": [("b1", "mit"), ("b2", "mit")],
+        "gamma": [("g1", "bsd-3-clause")],
+    }
+
+    def setUp(self):
+        """Serve three orgs and their repos."""
+        self.server = StubServer().start()
+        for org_name, repos in self.REPOS.items():
+            self.serve_org(org_name, repos)
+        self.url_patcher = patch.object(
+            GithubOrgClient, "ORG_URL", self.server.url("/orgs/{org}"))
+        self.url_patcher.start()
+
+    def tearDown(self):
+        """Stop patching and release the stub server."""
+        self.url_patcher.stop()
+        self.server.stop()
+
+    def serve_org(self, org_name, repos):
+        """Route an org and its repos list to the stub server."""
+        repos_path = "/orgs/{}/repos".format(org_name)
+        self.server.routes["/orgs/" + org_name] = {
+            "repos_url": self.server.url(repos_path)}
+        self.server.routes[repos_path] = [
+            {"name": name, "license": license_key and {"key": license_key}}
+            for name, license_key in repos
+        ]
+
+    def test_public_repos(self):
+        """Test that per-org queries match GithubOrgClient."""
+        batch = GithubOrgBatchClient(["alpha", "beta", "gamma"])
+        self.assertEqual(batch.orgs, ["alpha", "beta", "gamma"])
+        for org_name in self.REPOS:
+            client = GithubOrgClient(org_name)
+            self.assertEqual(batch.public_repos(org_name),
+                             client.public_repos())
+            for license_key in ("mit", "apache-2.0", "bsd-3-clause"):
+                self.assertEqual(
+                    batch.public_repos(org_name, license=license_key),
+                    client.public_repos(license=license_key))
+        with self.assertRaises(KeyError):
+            batch.public_repos("delta")
+
+    def test_repos_with_license(self):
+        """Test the cross-org license index."""
+        batch = GithubOrgBatchClient(["alpha", "beta", "gamma"])
+        self.assertEqual(batch.repos_with_license("mit"),
+                         {"alpha": ["a1"], "beta": ["b1", "b2"]})
+        self.assertEqual(batch.repos_with_license("gpl-3.0"), {})
+        self.assertEqual(batch.licenses(),
+                         ["apache-2.0", "bsd-3-clause", "mit"])
+
+    def test_incremental_refresh(self):
+        """Test that refresh and add_orgs only refetch the given orgs."""
+        batch = GithubOrgBatchClient(["alpha", "beta"])
+        self.serve_org("beta", [("b3", "apache-2.0")])
+        self.serve_org("alpha", [("a9", "mit")])
+        self.server.requests.clear()
+
+        batch.refresh(["beta"])
+        fetched = {path for path, _, _ in self.server.requests}
+        self.assertEqual(fetched, {"/orgs/beta", "/orgs/beta/repos"})
+        self.assertEqual(batch.repos_with_license("mit"), {"alpha": ["a1"]})
+        self.assertEqual(batch.public_repos("beta", license="apache-2.0"),
+                         ["b3"])
+
+        batch.add_orgs(["beta", "gamma"])
+        self.assertEqual(batch.orgs, ["alpha", "beta", "gamma"])
+        self.assertEqual(batch.public_repos("gamma"), ["g1"])
+
+    def test_failed_org_is_not_added(self):
+        """Test that one missing org neither blocks nor breaks the rest."""
+        with self.assertRaises(OrgFetchError) as raised:
+            GithubOrgBatchClient(["alpha", "typo"])
+        self.assertEqual(set(raised.exception.failures), {"typo"})
+
+        batch = GithubOrgBatchClient(["alpha"])
+        with self.assertRaises(OrgFetchError):
+            batch.add_orgs(["beta", "typo"])
+        self.assertEqual(batch.orgs, ["alpha", "beta"])
+        self.assertEqual(batch.public_repos("beta"), ["b1", "b2"])
+
+        batch.refresh()
+        self.assertEqual(batch.repos_with_license("mit"),
+                         {"alpha": ["a1"], "beta": ["b1", "b2"]})
+
+    def test_page_requests_fit_the_session_pool(self):
+        """Test that orgs in flight split the pooled connections."""
+        batch = GithubOrgBatchClient(["alpha", "beta"], max_workers=4)
+        self.assertEqual(batch._clients["alpha"].max_workers,
+                         client_module.MAX_WORKERS // 4)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -6,11 +6,35 @@ This module contains comprehensive unit tests for the utils module,
 including tests for nested map access, JSON retrieval, and memoization.
 """
 
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch, Mock
 from parameterized import parameterized
-from utils import access_nested_map, get_json, memoize
+from utils import (
+    HTTPCache,
+    access_nested_map,
+    compile_path,
+    extract_many,
+    get_json,
+    get_json_many,
+    iter_json_array,
+    iter_json_pages,
+    iter_json_stream,
+    memoize,
+    memoize_stats,
+    project,
+    reset_memoize_stats,
+    set_http_cache,
+    synchronized_memoize,
+    DEFAULT_TIMEOUT,
+)
 from client import GithubOrgClient
+from fixtures import StubServer
 
 class TestAccessNestedMap(unittest.TestCase):
     """Test class for access_nested_map function."""
@@ -33,6 +57,40 @@ class TestAccessNestedMap(unittest.TestCase):
         with self.assertRaises(KeyError):
             access_nested_map(nested_map, path)
 
+class TestCompilePath(unittest.TestCase):
+    """Test class for compile_path and extract_many."""
+
+    @parameterized.expand([
+        ({"a": 1}, ("a",), 1),
+        ({"a": {"b": 2}}, ("a",), {"b": 2}),
+        ({"a": {"b": 2}}, ("a", "b"), 2),
+    ])
+    def test_compile_path(self, nested_map, path, expected):
+        """Test that compiled getters match access_nested_map."""
+        self.assertEqual(compile_path(path)(nested_map), expected)
+
+    @parameterized.expand([
+        ({}, ("a",)),
+        ({"a": 1}, ("a", "b")),
+        ({"a": None}, ("a", "b")),
+        ([1, 2], (0,)),
+    ])
+    def test_compile_path_exception(self, nested_map, path):
+        """Test that compiled getters raise KeyError like the original."""
+        with self.assertRaises(KeyError):
+            compile_path(path)(nested_map)
+
+    def test_extract_many(self):
+        """Test that several paths are pulled from every record."""
+        repos = [
+            {"name": "a", "license": {"key": "mit"}},
+            {"name": "b", "license": None},
+            {"name": "c"},
+        ]
+        result = extract_many(repos, [("name",), ("license", "key")])
+        self.assertEqual(result, [("a", "mit"), ("b", None), ("c", None)])
+
+
 class TestGetJson(unittest.TestCase):
     """Test class for get_json function."""
 
@@ -40,14 +98,14 @@ class TestGetJson(unittest.TestCase):
         ("http://example.com", {"payload": True}),
         ("http://holberton.io", {"payload": False}),
     ])
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_json(self, test_url, test_payload, mock_get):
-        """Test that get_json returns expected results and calls requests.get.
+        """Test that get_json returns expected results through the session.
         
         Args:
             test_url: The URL to test with
             test_payload: The expected JSON payload
-            mock_get: The mocked requests.get function
+            mock_get: The mocked requests.Session.get method
         """
         mock_response = Mock()
         mock_response.json.return_value = test_payload
@@ -55,9 +113,267 @@ class TestGetJson(unittest.TestCase):
 
         result = get_json(test_url)
 
-        mock_get.assert_called_once_with(test_url)
+        mock_get.assert_called_once_with(test_url, timeout=DEFAULT_TIMEOUT,
+                                         headers={})
         self.assertEqual(result, test_payload)
 
+
+class TestGetJsonMany(unittest.TestCase):
+    """Test class for the pooled, concurrent JSON fetchers."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a local stub server with a handful of JSON routes."""
+        cls.attempts = 0
+
+        def flaky(handler):
+            cls.attempts += 1
+            if cls.attempts == 1:
+                return 503, {}, {"message": "unavailable"}
+            return 200, {}, {"recovered": True}
+
+        routes = {"/items/{}".format(i): {"item": i} for i in range(10)}
+        routes["/flaky"] = flaky
+        cls.server = StubServer(routes).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub server."""
+        cls.server.stop()
+
+    def test_get_json_many_keeps_order(self):
+        """Test that concurrent results come back in request order."""
+        urls = [self.server.url("/items/{}".format(i)) for i in range(10)]
+        result = get_json_many(urls, max_workers=4)
+        self.assertEqual(result, [{"item": i} for i in range(10)])
+
+    def test_get_json_reuses_connection(self):
+        """Test that sequential calls share one keep-alive connection."""
+        del self.server.requests[:]
+        for i in range(5):
+            get_json(self.server.url("/items/{}".format(i)))
+        ports = {port for _, port, _ in self.server.requests}
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(len(ports), 1)
+
+    def test_get_json_retries_server_errors(self):
+        """Test that a 503 is retried and the next response returned."""
+        result = get_json(self.server.url("/flaky"))
+        self.assertEqual(result, {"recovered": True})
+        self.assertEqual(self.attempts, 2)
+
+
+class TestIterJsonPages(unittest.TestCase):
+    """Test class for iter_json_pages."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Serve a four page array and a next-link-only array."""
+        cls.server = StubServer().start()
+        paged_url = cls.server.url("/paged")
+        linked_url = cls.server.url("/linked")
+
+        def paged(handler):
+            page = int(handler.path.partition("&page=")[2] or 1)
+            headers = {}
+            if page == 1:
+                headers["Link"] = '<{}?per_page=2&page=4>; rel="last"'.format(
+                    paged_url)
+            return 200, headers, [page * 10, page * 10 + 1]
+
+        def linked(handler):
+            page = int(handler.path.partition("page=")[2] or 1)
+            headers = {}
+            if page < 3:
+                headers["Link"] = '<{}?page={}>; rel="next"'.format(
+                    linked_url, page + 1)
+            return 200, headers, [page]
+
+        cls.server.routes.update({"/paged": paged, "/linked": linked})
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub server."""
+        cls.server.stop()
+
+    def test_iter_json_pages_uses_last_link(self):
+        """Test that every page up to `last` is fetched, in order."""
+        result = list(iter_json_pages(self.server.url("/paged?per_page=2")))
+        self.assertEqual(result, [10, 11, 20, 21, 30, 31, 40, 41])
+
+    def test_iter_json_pages_requests_pages_before_first_yield(self):
+        """Test that later pages are in flight while page 1 is consumed."""
+        self.server.requests.clear()
+        pages = iter_json_pages(self.server.url("/paged?per_page=2"))
+        self.assertEqual(next(pages), 10)
+        deadline = time.time() + 5
+        while len(self.server.requests) < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        pages.close()
+        self.assertEqual(
+            sorted(path for path, _, _ in self.server.requests)[-1],
+            "/paged?per_page=2&page=4")
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_iter_json_pages_follows_next_link(self):
+        """Test that `next` links are followed without a `last` link."""
+        result = list(iter_json_pages(self.server.url("/linked")))
+        self.assertEqual(result, [1, 2, 3])
+
+
+class TestIterJsonArray(unittest.TestCase):
+    """Test class for the incremental JSON array decoder."""
+
+    DOCUMENT = json.dumps([
+        {"name": "caf\u00e9 [repo]", "license": {"key": "mit"}},
+        12345,
+        [1.5e3, None, True],
+        "a, \"quoted\" ] string",
+        {},
+    ], ensure_ascii=False).encode()
+
+    @parameterized.expand([
+        ("whole", len(DOCUMENT)),
+        ("bytes", 1),
+        ("small", 7),
+    ])
+    def test_iter_json_array(self, _, chunk_size):
+        """Test that any chunking decodes to the same elements."""
+        chunks = [self.DOCUMENT[i:i + chunk_size]
+                  for i in range(0, len(self.DOCUMENT), chunk_size)]
+        self.assertEqual(list(iter_json_array(chunks)),
+                         json.loads(self.DOCUMENT))
+
+    @parameterized.expand([
+        (b" [ ] ", []),
+        (b"[1,2]", [1, 2]),
+    ])
+    def test_iter_json_array_edges(self, document, expected):
+        """Test empty arrays, whitespace and a trailing number."""
+        self.assertEqual(list(iter_json_array([document])), expected)
+
+    @parameterized.expand([
+        (b'{"a": 1}',),
+        (b"[1, 2",),
+        (b'[{"a": ',),
+        (b"[1 2]",),
+        (b"[1] 2",),
+    ])
+    def test_iter_json_array_invalid(self, document):
+        """Test that malformed or truncated arrays raise ValueError."""
+        with self.assertRaises(ValueError):
+            list(iter_json_array([document]))
+
+    def test_project(self):
+        """Test that only the requested paths are kept."""
+        paths = [("name",), ("license", "key")]
+        self.assertEqual(
+            project({"name": "a", "owner": {"id": 1},
+                     "license": {"key": "mit", "url": "x"}}, paths),
+            {"name": "a", "license": {"key": "mit"}})
+        self.assertEqual(project({"name": "b", "license": None}, paths),
+                         {"name": "b"})
+
+
+class TestIterJsonStream(unittest.TestCase):
+    """Test class for iter_json_stream."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Serve a two page array of repos linked by `next`."""
+        cls.server = StubServer().start()
+        repos_url = cls.server.url("/repos")
+
+        def repos(handler):
+            page = int(handler.path.partition("page=")[2] or 1)
+            headers = {}
+            if page == 1:
+                headers["Link"] = '<{}?page=2>; rel="next"'.format(repos_url)
+            return 200, headers, [
+                {"name": "repo{}".format(page), "owner": {"id": page},
+                 "license": {"key": "mit"}},
+            ]
+
+        cls.server.routes["/repos"] = repos
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stub server."""
+        cls.server.stop()
+
+    def test_iter_json_stream(self):
+        """Test that every page is streamed and projected."""
+        result = list(iter_json_stream(
+            self.server.url("/repos"), fields=[("name",), ("license", "key")],
+            chunk_size=8))
+        self.assertEqual(result, [
+            {"name": "repo1", "license": {"key": "mit"}},
+            {"name": "repo2", "license": {"key": "mit"}},
+        ])
+
+    def test_iter_json_stream_without_fields(self):
+        """Test that items are returned whole without a projection."""
+        result = list(iter_json_stream(self.server.url("/repos")))
+        self.assertEqual(result[1]["owner"], {"id": 2})
+
+
+class TestHTTPCache(unittest.TestCase):
+    """Test class for the on-disk conditional request cache."""
+
+    def setUp(self):
+        """Serve an ETag-validated resource and install a fresh cache."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = HTTPCache(os.path.join(self.tmpdir.name, "http.db"))
+        set_http_cache(self.cache)
+        self.server = StubServer().start()
+
+        def tagged(handler):
+            if handler.headers.get("If-None-Match") == '"v1"':
+                return 304, {"ETag": '"v1"'}, None
+            return 200, {"ETag": '"v1"'}, {"version": 1}
+
+        self.server.routes["/tagged"] = tagged
+
+    def tearDown(self):
+        """Remove the cache and stop the stub server."""
+        set_http_cache(None)
+        self.cache.close()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def test_not_modified_served_from_disk(self):
+        """Test that a 304 answer returns the cached body."""
+        url = self.server.url("/tagged")
+        self.assertEqual(get_json(url), {"version": 1})
+        self.assertEqual(get_json(url), {"version": 1})
+
+        first, second = [headers for _, _, headers in self.server.requests]
+        self.assertNotIn("If-None-Match", first)
+        self.assertEqual(second["If-None-Match"], '"v1"')
+
+    def test_cache_survives_new_instance(self):
+        """Test that entries persist on disk across cache instances."""
+        url = self.server.url("/tagged")
+        get_json(url)
+        self.cache.close()
+        self.cache = HTTPCache(os.path.join(self.tmpdir.name, "http.db"))
+        set_http_cache(self.cache)
+        self.assertEqual(self.cache.get(url)["etag"], '"v1"')
+
+    def test_least_recently_used_evicted(self):
+        """Test that the oldest unused entry goes first over the limit."""
+        content = os.urandom(400)
+        self.cache.max_bytes = 1000
+        for name in ("a", "b"):
+            self.cache.put(name, content, '"e"', None, None)
+        self.cache.touch("a")
+        self.cache.put("c", content, '"e"', None, None)
+
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("c"))
+
+
 class TestMemoize(unittest.TestCase):
     """Test class for memoize decorator."""
 
@@ -86,6 +402,98 @@ class TestMemoize(unittest.TestCase):
             self.assertEqual(result2, 42)
             mock_method.assert_called_once()
 
+class TestSynchronizedMemoize(unittest.TestCase):
+    """Test class for the synchronized_memoize decorator."""
+
+    def setUp(self):
+        """Start every test with empty counters."""
+        reset_memoize_stats()
+
+    def test_single_flight_across_threads(self):
+        """Test that racing threads trigger a single computation."""
+        calls = []
+
+        class TestClass:
+            """Test class with a slow memoized property."""
+
+            @synchronized_memoize
+            def a_property(self):
+                """Slow memoized property."""
+                calls.append(1)
+                time.sleep(0.05)
+                return 42
+
+        test_instance = TestClass()
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(test_instance.a_property))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [42] * 8)
+        self.assertEqual(len(calls), 1)
+        stats = memoize_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (7, 1))
+
+    def test_ttl_and_invalidation(self):
+        """Test that values expire after ttl and on del."""
+        clock = Mock(return_value=100.0)
+
+        class TestClass:
+            """Test class with an expiring memoized property."""
+
+            def a_method(self):
+                """Return a test value."""
+                return 42
+
+            @synchronized_memoize(ttl=10, clock=clock)
+            def a_property(self):
+                """Memoized property that calls a_method."""
+                return self.a_method()
+
+        test_instance = TestClass()
+        with patch.object(test_instance, 'a_method',
+                          return_value=42) as mock_method:
+            test_instance.a_property
+            test_instance.a_property
+            self.assertEqual(mock_method.call_count, 1)
+
+            clock.return_value = 111.0
+            test_instance.a_property
+            self.assertEqual(mock_method.call_count, 2)
+
+            del test_instance.a_property
+            test_instance.a_property
+            self.assertEqual(mock_method.call_count, 3)
+
+    def test_async_method(self):
+        """Test that concurrent awaits of a coroutine share one call."""
+        calls = []
+
+        class TestClass:
+            """Test class with a memoized coroutine property."""
+
+            @synchronized_memoize
+            async def a_property(self):
+                """Memoized coroutine property."""
+                calls.append(1)
+                await asyncio.sleep(0.01)
+                return 42
+
+        async def gather():
+            test_instance = TestClass()
+            return await asyncio.gather(
+                *(test_instance.a_property for _ in range(5)))
+
+        self.assertEqual(asyncio.run(gather()), [42] * 5)
+        self.assertEqual(len(calls), 1)
+
+
 class TestGithubOrgClient(unittest.TestCase):
     """Test class for GithubOrgClient."""
 
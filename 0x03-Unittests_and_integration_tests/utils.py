@@ -1,22 +1,65 @@
 #!/usr/bin/env python3
 """Generic utilities for github org client.
 """
+import asyncio
+import codecs
+import inspect
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from functools import wraps
+from requests.adapters import HTTPAdapter
+from requests.utils import parse_header_links
+from urllib3.util.retry import Retry
+from functools import update_wrapper, wraps
+from operator import itemgetter
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
 from typing import (
     Mapping,
     Sequence,
     Any,
     Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
     Callable,
 )
 
 __all__ = [
+    "HTTPCache",
     "access_nested_map",
+    "compile_path",
+    "extract_many",
     "get_json",
+    "get_json_many",
+    "get_session",
+    "iter_json_array",
+    "iter_json_pages",
+    "iter_json_stream",
     "memoize",
+    "memoize_stats",
+    "project",
+    "reset_memoize_stats",
+    "set_http_cache",
+    "synchronized_memoize",
 ]
 
+DEFAULT_TIMEOUT = 10
+STREAM_CHUNK_SIZE = 64 * 1024
+MAX_WORKERS = 8
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_http_cache = None
+_memoize_stats: Dict[str, Dict[str, int]] = {}
+_memoize_stats_lock = threading.Lock()
+
 
 def access_nested_map(nested_map: Mapping, path: Sequence) -> Any:
     """Access nested map with key path.
@@ -40,11 +83,426 @@ def access_nested_map(nested_map: Mapping, path: Sequence) -> Any:
     return nested_map
 
 
-def get_json(url: str) -> Dict:
+def compile_path(path: Sequence) -> Callable[[Mapping], Any]:
+    """Compile a key path into a getter for repeated lookups.
+    The getter behaves like access_nested_map, raising KeyError on a
+    missing key or a non-mapping value, but the keys are bound to
+    itemgetters once and plain dicts skip the Mapping ABC check.
+    Example
+    -------
+    >>> get_license_key = compile_path(("license", "key"))
+    >>> get_license_key({"license": {"key": "mit"}})
+    'mit'
+    """
+    steps = tuple((key, itemgetter(key)) for key in path)
+
+    if len(steps) == 1:
+        (key, get), = steps
+
+        def getter(nested_map: Mapping) -> Any:
+            """Compiled single-key getter"""
+            if type(nested_map) is not dict \
+                    and not isinstance(nested_map, Mapping):
+                raise KeyError(key)
+            return get(nested_map)
+
+        return getter
+
+    def getter(nested_map: Mapping) -> Any:
+        """Compiled key path getter"""
+        for key, get in steps:
+            if type(nested_map) is not dict \
+                    and not isinstance(nested_map, Mapping):
+                raise KeyError(key)
+            nested_map = get(nested_map)
+        return nested_map
+
+    return getter
+
+
+def extract_many(payload: Iterable[Mapping], paths: Sequence[Sequence],
+                 default: Any = None) -> List[Tuple]:
+    """Pull several key paths out of every record in one pass.
+    Parameters
+    ----------
+    payload: Iterable[Mapping]
+        records, e.g. a repos payload
+    paths: Sequence[Sequence]
+        key paths to extract from each record
+    default: Any
+        value used where a path is missing
+    Example
+    -------
+    >>> repos = [{"name": "a", "license": {"key": "mit"}},
+    ...          {"name": "b", "license": None}]
+    >>> extract_many(repos, [("name",), ("license", "key")])
+    [('a', 'mit'), ('b', None)]
+    """
+    getters = [compile_path(path) for path in paths]
+    rows = []
+    for record in payload:
+        row = []
+        for getter in getters:
+            try:
+                row.append(getter(record))
+            except KeyError:
+                row.append(default)
+        rows.append(tuple(row))
+    return rows
+
+
+def get_session() -> requests.Session:
+    """Get the shared HTTP session.
+    The session keeps connections alive between calls, holds up to
+    MAX_WORKERS pooled connections per host, and retries connection
+    errors and 429/5xx responses with exponential backoff.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=3,
+                    backoff_factor=0.3,
+                    status_forcelist=RETRY_STATUSES,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=MAX_WORKERS,
+                    pool_maxsize=MAX_WORKERS,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+class HTTPCache:
+    """On-disk cache of JSON responses keyed by URL.
+    Each entry keeps the zlib-compressed body with the ETag,
+    Last-Modified and Link headers in a single SQLite file. Once the
+    stored bodies exceed `max_bytes`, the least recently used entries
+    are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024) -> None:
+        """Init method of HTTPCache"""
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+                "link TEXT, body BLOB NOT NULL, size INTEGER NOT NULL, "
+                "accessed_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+                "ON responses (accessed_at)"
+            )
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Cached entry for a URL, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, link, body FROM responses "
+                "WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, link, body = row
+        return {"etag": etag, "last_modified": last_modified,
+                "link": link, "body": body}
+
+    def touch(self, url: str) -> None:
+        """Mark an entry as recently used"""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE responses SET accessed_at = ? WHERE url = ?",
+                (time.time(), url)
+            )
+
+    def put(self, url: str, content: bytes, etag: Optional[str],
+            last_modified: Optional[str], link: Optional[str]) -> None:
+        """Store a response body and its validators, then evict entries
+        until the cache fits in `max_bytes`"""
+        body = zlib.compress(content)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, link, body, len(body), time.time())
+            )
+            total = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            oldest = self._db.execute(
+                "SELECT url, size FROM responses ORDER BY accessed_at")
+            evicted = []
+            for old_url, size in oldest:
+                if total <= self.max_bytes:
+                    break
+                evicted.append((old_url,))
+                total -= size
+            self._db.executemany(
+                "DELETE FROM responses WHERE url = ?", evicted)
+
+    def close(self) -> None:
+        """Close the underlying database"""
+        self._db.close()
+
+
+def set_http_cache(cache: Optional[HTTPCache]) -> None:
+    """Send conditional requests through `cache`, or stop caching with None.
+    """
+    global _http_cache
+    _http_cache = cache
+
+
+def _parse_links(link: Optional[str]) -> Dict:
+    """Parse a Link header the way requests fills `Response.links`."""
+    links = {}
+    for entry in parse_header_links(link or ""):
+        links[entry.get("rel") or entry.get("url")] = entry
+    return links
+
+
+def _fetch_json(url: str,
+                timeout: float = DEFAULT_TIMEOUT) -> Tuple[Any, Dict]:
+    """Get JSON and the parsed Link header relations from remote URL.
+    With an HTTP cache set, known URLs are requested conditionally and a
+    304 Not Modified is answered from disk.
+    """
+    cache = _http_cache
+    entry = cache.get(url) if cache is not None else None
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = get_session().get(url, timeout=timeout, headers=headers)
+
+    if entry is not None and response.status_code == 304:
+        cache.touch(url)
+        payload = json.loads(zlib.decompress(entry["body"]))
+        return payload, _parse_links(entry["link"])
+
+    payload = response.json()
+    if cache is not None and response.status_code == 200:
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            cache.put(url, response.content, etag, last_modified,
+                      response.headers.get("Link"))
+    return payload, response.links
+
+
+def get_json(url: str, timeout: float = DEFAULT_TIMEOUT) -> Dict:
     """Get JSON from remote URL.
     """
-    response = requests.get(url)
-    return response.json()
+    return _fetch_json(url, timeout)[0]
+
+
+def get_json_many(urls: Sequence[str],
+                  max_workers: int = MAX_WORKERS) -> List[Dict]:
+    """Get JSON from several remote URLs concurrently.
+    Parameters
+    ----------
+    urls: Sequence[str]
+        URLs to fetch
+    max_workers: int
+        maximum number of requests in flight at once
+    Returns
+    -------
+    The payloads, in the same order as `urls`.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(get_json, urls))
+
+
+def _remaining_page_urls(links: Dict) -> List[str]:
+    """URLs of pages 2 to N, where N is the page of the `last` relation.
+    """
+    last = links.get("last", {}).get("url")
+    if not last:
+        return []
+    parts = urlsplit(last)
+    query = parse_qs(parts.query, keep_blank_values=True)
+    last_page = int(query.get("page", ["1"])[0])
+
+    urls = []
+    for page in range(2, last_page + 1):
+        query["page"] = [str(page)]
+        urls.append(urlunsplit(
+            parts._replace(query=urlencode(query, doseq=True))))
+    return urls
+
+
+def iter_json_pages(url: str,
+                    max_workers: int = MAX_WORKERS) -> Iterator[Any]:
+    """Yield the items of a paginated JSON array across every page.
+    The first page is fetched on its own. The page count comes from the
+    `last` relation of its Link header, and the remaining pages are
+    requested concurrently before the first page's items are yielded.
+    Items are yielded in page order as soon as each page arrives. Without
+    a `last` relation, `next` links are followed one page at a time.
+    Parameters
+    ----------
+    url: str
+        URL of the first page
+    max_workers: int
+        maximum number of page requests in flight at once
+    """
+    payload, links = _fetch_json(url)
+
+    page_urls = _remaining_page_urls(links)
+    if page_urls:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = [executor.submit(get_json, page) for page in page_urls]
+        try:
+            yield from payload
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+        return
+
+    yield from payload
+    while "next" in links:
+        payload, links = _fetch_json(links["next"]["url"])
+        yield from payload
+
+
+_json_decoder = json.JSONDecoder()
+_JSON_WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Decode a JSON array incrementally, yielding one element at a time.
+    Only the undecoded tail of the input is buffered, so memory stays
+    proportional to the largest element plus one chunk, whatever the
+    length of the array.
+    Parameters
+    ----------
+    chunks: Iterable[bytes]
+        UTF-8 encoded pieces of the document, split anywhere
+    Example
+    -------
+    >>> list(iter_json_array([b'[{"a": 1}, ', b'2]']))
+    [{'a': 1}, 2]
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    state = "start"
+    eof = False
+    chunks = iter(chunks)
+
+    while not eof:
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            buffer += decoder.decode(b"", final=True)
+        else:
+            buffer += decoder.decode(chunk)
+
+        pos, end = 0, len(buffer)
+        while True:
+            while pos < end and buffer[pos] in _JSON_WHITESPACE:
+                pos += 1
+            if pos == end:
+                break
+            char = buffer[pos]
+            if state == "start":
+                if char != "[":
+                    raise ValueError("Expected a JSON array")
+                pos += 1
+                state = "first"
+            elif state == "first" and char == "]":
+                pos += 1
+                state = "done"
+            elif state in ("first", "item"):
+                try:
+                    item, item_end = _json_decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    break
+                # A number or literal running into the end of the buffer
+                # may continue in the next chunk
+                if item_end == end and not eof:
+                    break
+                yield item
+                pos = item_end
+                state = "separator"
+            elif state == "separator":
+                if char not in ",]":
+                    raise ValueError(
+                        "Expected ',' or ']' at offset {}".format(pos))
+                pos += 1
+                state = "item" if char == "," else "done"
+            else:
+                raise ValueError("Extra data after the JSON array")
+        buffer = buffer[pos:]
+
+    if state != "done":
+        raise ValueError("Truncated JSON array")
+
+
+def project(record: Mapping, paths: Sequence[Sequence]) -> Dict:
+    """Copy only the given key paths of a record into a new nested dict.
+    Paths missing from the record are left out.
+    Example
+    -------
+    >>> project({"name": "a", "owner": {"id": 1}, "license": {"key": "mit"}},
+    ...         [("name",), ("license", "key")])
+    {'name': 'a', 'license': {'key': 'mit'}}
+    """
+    projected: Dict = {}
+    for path in paths:
+        try:
+            value = access_nested_map(record, path)
+        except KeyError:
+            continue
+        target = projected
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = value
+    return projected
+
+
+def iter_json_stream(url: str, fields: Optional[Sequence[Sequence]] = None,
+                     chunk_size: int = STREAM_CHUNK_SIZE,
+                     timeout: float = DEFAULT_TIMEOUT) -> Iterator[Any]:
+    """Stream the items of a paginated JSON array without decoding whole
+    pages.
+    Each page body is parsed with iter_json_array as it is read from the
+    socket, and items are projected to `fields` before being yielded, so
+    at most one item is held in full. Pages are fetched one at a time
+    through their `next` link, trading the concurrency of
+    iter_json_pages for a flat memory profile, and the HTTP cache is
+    bypassed since it stores whole bodies.
+    Parameters
+    ----------
+    url: str
+        URL of the first page
+    fields: Sequence[Sequence]
+        key paths to keep in each item, or None to keep everything
+    chunk_size: int
+        bytes read from the response per step
+    """
+    while url:
+        with get_session().get(url, timeout=timeout,
+                               stream=True) as response:
+            response.raise_for_status()
+            for item in iter_json_array(response.iter_content(chunk_size)):
+                yield item if fields is None else project(item, fields)
+            url = response.links.get("next", {}).get("url")
 
 
 def memoize(fn: Callable) -> Callable:
@@ -73,3 +531,152 @@ def memoize(fn: Callable) -> Callable:
         return getattr(self, attr_name)
 
     return property(memoized)
+
+
+def _record_memoize(name: str, outcome: str) -> None:
+    """Count a memoize hit or miss for `name`."""
+    with _memoize_stats_lock:
+        counters = _memoize_stats.setdefault(name, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+
+def memoize_stats() -> Dict[str, Any]:
+    """Process-wide hit/miss counters of synchronized_memoize.
+    Returns
+    -------
+    Totals under "hits" and "misses", and per-method counters keyed by
+    qualified name under "methods".
+    """
+    with _memoize_stats_lock:
+        methods = {name: dict(counts)
+                   for name, counts in _memoize_stats.items()}
+    return {
+        "hits": sum(counts["hits"] for counts in methods.values()),
+        "misses": sum(counts["misses"] for counts in methods.values()),
+        "methods": methods,
+    }
+
+
+def reset_memoize_stats() -> None:
+    """Reset the synchronized_memoize counters."""
+    with _memoize_stats_lock:
+        _memoize_stats.clear()
+
+
+class _SynchronizedMemoized:
+    """Property-like descriptor behind synchronized_memoize."""
+
+    def __init__(self, fn: Callable, ttl: Optional[float],
+                 clock: Callable[[], float]) -> None:
+        """Init method of _SynchronizedMemoized"""
+        update_wrapper(self, fn)
+        self.fn = fn
+        self.ttl = ttl
+        self.clock = clock
+        self.is_async = inspect.iscoroutinefunction(fn)
+        self.attr_name = "_{}".format(fn.__name__)
+        self.lock_name = "_{}_lock".format(fn.__name__)
+
+    def _lookup(self, obj: Any) -> Tuple[bool, Any]:
+        """(True, value) for a fresh cached value, else (False, None)"""
+        entry = obj.__dict__.get(self.attr_name)
+        if entry is None:
+            return False, None
+        value, expires_at = entry
+        if expires_at is not None and self.clock() >= expires_at:
+            return False, None
+        return True, value
+
+    def _store(self, obj: Any, value: Any) -> None:
+        """Cache a value, stamped with its expiry time"""
+        expires_at = None
+        if self.ttl is not None:
+            expires_at = self.clock() + self.ttl
+        obj.__dict__[self.attr_name] = (value, expires_at)
+
+    def _lock(self, obj: Any, factory: Callable) -> Any:
+        """Per-instance lock; setdefault keeps a single lock on races"""
+        lock = obj.__dict__.get(self.lock_name)
+        if lock is None:
+            lock = obj.__dict__.setdefault(self.lock_name, factory())
+        return lock
+
+    def _get(self, obj: Any) -> Any:
+        """Cached value, computing it once however many threads ask"""
+        hit, value = self._lookup(obj)
+        if not hit:
+            with self._lock(obj, threading.Lock):
+                hit, value = self._lookup(obj)
+                if not hit:
+                    _record_memoize(self.__qualname__, "misses")
+                    value = self.fn(obj)
+                    self._store(obj, value)
+                    return value
+        _record_memoize(self.__qualname__, "hits")
+        return value
+
+    async def _get_async(self, obj: Any) -> Any:
+        """Cached value of a coroutine method, awaited once per refill"""
+        hit, value = self._lookup(obj)
+        if not hit:
+            async with self._lock(obj, asyncio.Lock):
+                hit, value = self._lookup(obj)
+                if not hit:
+                    _record_memoize(self.__qualname__, "misses")
+                    value = await self.fn(obj)
+                    self._store(obj, value)
+                    return value
+        _record_memoize(self.__qualname__, "hits")
+        return value
+
+    def __get__(self, obj: Any, objtype: type = None) -> Any:
+        """Cached value, or an awaitable of it for coroutine methods"""
+        if obj is None:
+            return self
+        if self.is_async:
+            return self._get_async(obj)
+        return self._get(obj)
+
+    def __set__(self, obj: Any, value: Any) -> None:
+        """Prime the cache with a value computed elsewhere"""
+        self._store(obj, value)
+
+    def __delete__(self, obj: Any) -> None:
+        """Invalidate the cached value so the next access recomputes it"""
+        obj.__dict__.pop(self.attr_name, None)
+
+    def is_cached(self, obj: Any) -> bool:
+        """Whether `obj` holds a fresh cached value"""
+        return self._lookup(obj)[0]
+
+
+def synchronized_memoize(fn: Callable = None, *,
+                         ttl: Optional[float] = None,
+                         clock: Callable[[], float] = time.monotonic) -> Any:
+    """Decorator to memoize a method, safely shared between threads.
+    Unlike memoize, concurrent first accesses on one instance wait on a
+    per-instance lock so the method runs once (single flight). Values
+    can expire after `ttl` seconds, `del obj.attr` invalidates them, and
+    coroutine methods are supported (`await obj.attr`). Hits and misses
+    are counted in memoize_stats(). Expiry is measured with `clock`.
+    Example
+    -------
+    class MyClass:
+        @synchronized_memoize(ttl=60)
+        def a_method(self):
+            print("a_method called")
+            return 42
+    >>> my_object = MyClass()
+    >>> my_object.a_method
+    a_method called
+    42
+    >>> my_object.a_method
+    42
+    >>> del my_object.a_method
+    >>> my_object.a_method
+    a_method called
+    42
+    """
+    if fn is None:
+        return lambda fn: _SynchronizedMemoized(fn, ttl, clock)
+    return _SynchronizedMemoized(fn, ttl, clock)
@@ -0,0 +1,330 @@
+"""
+Cache layer for the messaging app.
+
+App code goes through `get_shared_cache()` instead of Django's `cache`,
+so the store behind it can be shared by every worker process:
+
+- DjangoSharedCache wraps a Django cache alias (LocMemCache in
+  development, where there is a single process anyway)
+- RedisSharedCache talks to Redis through a raw redis-py client, which
+  is the one django-redis already holds when REDIS_URL is configured
+- NearCache keeps a small in-process LRU with a short TTL in front of
+  either of them, so hot entries such as message pages are read from
+  memory most of the time
+
+Keys whose value must never be stale, such as conversation versions,
+are read and written on `origin`, the store behind any near cache.
+"""
+import pickle
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+CONVERSATION_VERSION_KEY = 'messaging:conversation:{conversation_id}:version'
+MESSAGE_PAGE_KEY = 'messaging:conversation:{conversation_id}:v{version}:user:{user_id}:{query}'
+MESSAGE_PAGE_TIMEOUT = 60
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+class SharedCache(ABC):
+    """
+    Interface of the cache stores; timeouts are in seconds, None for
+    no expiry
+    """
+
+    @property
+    def origin(self):
+        """The store itself, without any in-process layer in front"""
+        return self
+
+    @property
+    def is_cross_process(self):
+        """Whether every worker process sees the same entries"""
+        return True
+
+    @abstractmethod
+    def get(self, key, default=None):
+        pass
+
+    @abstractmethod
+    def set(self, key, value, timeout=None):
+        pass
+
+    @abstractmethod
+    def add(self, key, value, timeout=None):
+        """Set the key only if it is missing; True if it was set"""
+
+    @abstractmethod
+    def incr(self, key, delta=1):
+        """Increment an integer value; ValueError if the key is missing"""
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+
+class DjangoSharedCache(SharedCache):
+    """Store backed by one of the Django CACHES aliases"""
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    @property
+    def is_cross_process(self):
+        return not isinstance(self.cache, (LocMemCache, DummyCache))
+
+    def get(self, key, default=None):
+        return self.cache.get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self.cache.add(key, value, timeout)
+
+    def incr(self, key, delta=1):
+        return self.cache.incr(key, delta)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+
+class RedisSharedCache(SharedCache):
+    """
+    Store backed by a redis-py client. Integers are stored as plain
+    numbers so INCR works on them; everything else is pickled.
+    """
+    # INCRBY only an existing key, atomically, so a key that expired or
+    # was evicted is never recreated from zero
+    INCR_EXISTING_SCRIPT = """
+        if redis.call('EXISTS', KEYS[1]) == 1 then
+            return redis.call('INCRBY', KEYS[1], ARGV[1])
+        end
+        return false
+    """
+
+    def __init__(self, client, prefix=''):
+        self.client = client
+        self.prefix = prefix
+
+    def make_key(self, key):
+        return f"{self.prefix}{key}"
+
+    @staticmethod
+    def dumps(value):
+        if type(value) is int:
+            return str(value).encode()
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def loads(data):
+        # Pickles always start with the PROTO opcode, numbers never do
+        if data[:1] == pickle.PROTO:
+            return pickle.loads(data)
+        return int(data)
+
+    def get(self, key, default=None):
+        data = self.client.get(self.make_key(key))
+        return default if data is None else self.loads(data)
+
+    def set(self, key, value, timeout=None):
+        self.client.set(self.make_key(key), self.dumps(value), ex=timeout)
+
+    def add(self, key, value, timeout=None):
+        return bool(self.client.set(self.make_key(key), self.dumps(value), ex=timeout, nx=True))
+
+    def incr(self, key, delta=1):
+        key = self.make_key(key)
+        value = self.client.eval(self.INCR_EXISTING_SCRIPT, 1, key, delta)
+        if value is None:
+            raise ValueError(f"Key '{key}' not found")
+        return value
+
+    def delete(self, key):
+        self.client.delete(self.make_key(key))
+
+
+class NearCache(SharedCache):
+    """
+    In-process LRU in front of a shared store.
+
+    Reads are served locally for up to `ttl` seconds, so a write made by
+    another process can take that long to be seen here; writes from this
+    process go through to the shared store and drop the local copy.
+    """
+
+    def __init__(self, shared, max_entries=1024, ttl=2.0):
+        self.shared = shared
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def origin(self):
+        return self.shared.origin
+
+    @property
+    def is_cross_process(self):
+        return self.shared.is_cross_process
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = self.shared.get(key)
+        if value is None:
+            self._forget(key)
+            return default
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.shared.set(key, value, timeout)
+        self._forget(key)
+
+    def add(self, key, value, timeout=None):
+        added = self.shared.add(key, value, timeout)
+        self._forget(key)
+        return added
+
+    def incr(self, key, delta=1):
+        try:
+            return self.shared.incr(key, delta)
+        finally:
+            self._forget(key)
+
+    def delete(self, key):
+        self.shared.delete(key)
+        self._forget(key)
+
+    def clear_local(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def build_shared_cache():
+    """
+    Store picked from settings: Redis through django-redis's connection
+    with a near cache in front when the default cache is django-redis,
+    otherwise the default Django cache on its own
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend.startswith('django_redis.'):
+        from django_redis import get_redis_connection
+
+        return NearCache(
+            RedisSharedCache(get_redis_connection('default'), prefix='messaging:'),
+            max_entries=getattr(settings, 'MESSAGING_NEAR_CACHE_ENTRIES', 1024),
+            ttl=getattr(settings, 'MESSAGING_NEAR_CACHE_TTL', 2.0)
+        )
+    return DjangoSharedCache('default')
+
+
+def get_shared_cache():
+    """The process-wide cache store, built on first use"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = build_shared_cache()
+    return _shared_cache
+
+
+def set_shared_cache(cache):
+    """Replace the process-wide store (None rebuilds it from settings)"""
+    global _shared_cache
+    _shared_cache = cache
+
+
+def get_version(key):
+    """
+    Current value of a version counter, created on first use. Versions
+    are always read on the origin store: a bump made by another process
+    has to be seen at once, not after a near cache's TTL.
+    """
+    cache = get_shared_cache().origin
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1 so a version key evicted from
+        # the cache never comes back with a number older entries still use
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Move a version counter on, making entries keyed by it unreachable"""
+    cache = get_shared_cache().origin
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Another process may add it first; then bump theirs instead
+        if not cache.add(key, time.time_ns(), None):
+            cache.incr(key)
+
+
+def get_conversation_version(conversation_id):
+    """
+    Current generation of a conversation's messages; cached pages are
+    keyed by it, so bumping it makes every older page unreachable
+    """
+    return get_version(CONVERSATION_VERSION_KEY.format(conversation_id=conversation_id))
+
+
+def bump_conversation_version(conversation_id):
+    """Invalidate every cached message page of a conversation"""
+    bump_version(CONVERSATION_VERSION_KEY.format(conversation_id=conversation_id))
+
+
+def message_page_key(user_id, conversation_id, query_params):
+    """Cache key for one user's view of one page of a conversation"""
+    query = urlencode(sorted(query_params.items()))
+    return MESSAGE_PAGE_KEY.format(
+        conversation_id=conversation_id,
+        version=get_conversation_version(conversation_id),
+        user_id=user_id,
+        query=query
+    )
+
+
+def cached_message_page(request, conversation, build_page):
+    """
+    Serialized message page for the requesting user, built by
+    `build_page()` on a miss. Pages differ per user (is_own_message), so
+    the user is part of the key, and any side effects of the request
+    belong outside `build_page` since hits never call it.
+    """
+    cache = get_shared_cache()
+    key = message_page_key(request.user.pk, conversation.pk, request.query_params)
+    data = cache.get(key)
+    if data is None:
+        data = build_page()
+        cache.set(key, data, MESSAGE_PAGE_TIMEOUT)
+    return data
@@ -0,0 +1,148 @@
+"""
+Compact storage of message edit history.
+
+Each edit adds a MessageHistory row holding the body as it was before the
+edit. The newest row of a message always keeps its full text. When a newer
+row is added, the one before it is rewritten as a reverse delta against the
+new one, unless its version is a multiple of
+MESSAGE_HISTORY_SNAPSHOT_INTERVAL, so reading any version applies at most
+that many deltas, starting from the nearest newer full snapshot.
+
+A delta is a JSON list of [start, end] token ranges copied from the newer
+body and literal strings inserted between them. Bodies are tokenized into
+words and whitespace runs.
+"""
+import json
+import logging
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Message, MessageHistory
+
+TOKEN_PATTERN = re.compile(r'\s+|\S+')
+
+logger = logging.getLogger(__name__)
+
+
+def _settings():
+    return (
+        getattr(settings, 'MESSAGE_HISTORY_STORAGE', 'delta'),
+        getattr(settings, 'MESSAGE_HISTORY_SNAPSHOT_INTERVAL', 10),
+    )
+
+
+def make_delta(base, text):
+    """Delta that rebuilds `text` from `base`"""
+    base_tokens = TOKEN_PATTERN.findall(base)
+    text_tokens = TOKEN_PATTERN.findall(text)
+    matcher = SequenceMatcher(None, base_tokens, text_tokens, autojunk=False)
+    delta = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            delta.append([i1, i2])
+        elif j2 > j1:
+            delta.append(''.join(text_tokens[j1:j2]))
+    return delta
+
+
+def apply_delta(base, delta):
+    """Text rebuilt from `base` by a delta from make_delta()"""
+    base_tokens = TOKEN_PATTERN.findall(base)
+    return ''.join(
+        part if isinstance(part, str) else ''.join(base_tokens[part[0]:part[1]])
+        for part in delta
+    )
+
+
+def record_edit(message, previous_body, edited_by=None):
+    """
+    Add the body a message had before an edit to its history, and turn the
+    previous newest entry into a delta against it when that saves space
+    """
+    storage, interval = _settings()
+    with transaction.atomic():
+        # Concurrent edits of one message take turns, so they never read
+        # the same newest entry and pick the same version
+        Message.objects.select_for_update().filter(pk=message.pk).values_list('pk').first()
+        newest = MessageHistory.objects.filter(message=message).only(
+            'history_id', 'version', 'previous_body', 'delta'
+        ).order_by('-version').first()
+
+        entry = MessageHistory.objects.create(
+            message=message,
+            version=newest.version + 1 if newest else 1,
+            previous_body=previous_body,
+            edited_by=edited_by
+        )
+
+        if storage == 'delta' and newest is not None and newest.delta is None and newest.version % interval:
+            delta = make_delta(previous_body, newest.previous_body)
+            if len(json.dumps(delta)) < len(newest.previous_body):
+                MessageHistory.objects.filter(pk=newest.pk).update(previous_body='', delta=delta)
+    return entry
+
+
+def detach_history_entry(entry):
+    """
+    Before `entry` is deleted, store the next older entry in full if it is
+    a delta against it, so the older versions stay readable
+    """
+    older = MessageHistory.objects.filter(
+        message_id=entry.message_id,
+        version=entry.version - 1,
+        delta__isnull=False
+    ).first()
+    if older is not None:
+        body = history_bodies([older])[older.pk]
+        MessageHistory.objects.filter(pk=older.pk).update(previous_body=body, delta=None)
+
+
+def history_bodies(entries):
+    """
+    Full previous_body of each MessageHistory entry, keyed by pk.
+    Newer entries a delta depends on are fetched when not given, one
+    query per message at most. An entry whose chain is broken (a newer
+    entry removed without detach_history_entry) reads as '', with a
+    warning logged.
+    """
+    by_message = defaultdict(dict)
+    for entry in entries:
+        by_message[entry.message_id][entry.version] = entry
+
+    bodies = {}
+    for message_id, versions in by_message.items():
+        chain = dict(versions)
+        missing = [
+            version + 1 for version, entry in versions.items()
+            if entry.delta is not None and version + 1 not in versions
+        ]
+        if missing:
+            chain.update(
+                (entry.version, entry)
+                for entry in MessageHistory.objects.filter(
+                    message_id=message_id, version__gte=min(missing)
+                ).only('history_id', 'message_id', 'version', 'previous_body', 'delta')
+            )
+
+        newer_version, newer_body = None, None
+        for version in sorted(chain, reverse=True):
+            entry = chain[version]
+            if entry.delta is None:
+                newer_body = entry.previous_body
+            elif newer_body is not None and newer_version == version + 1:
+                newer_body = apply_delta(newer_body, entry.delta)
+            else:
+                newer_body = None
+            newer_version = version
+            if version in versions:
+                if newer_body is None:
+                    logger.warning(
+                        "Cannot rebuild version %s of message %s: a newer history entry is missing",
+                        version, message_id
+                    )
+                bodies[entry.pk] = '' if newer_body is None else newer_body
+    return bodies
@@ -0,0 +1,71 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from messaging.models import Message
+
+
+class Command(BaseCommand):
+    help = 'Fill in thread_root, path and depth of messages created before they existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of messages updated per query (default: 1000)'
+        )
+
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many messages need a thread position without updating them'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pending = Message.objects.filter(path='')
+
+        if options['dry_run']:
+            self.stdout.write(
+                self.style.SUCCESS(f'Would backfill {pending.count()} messages')
+            )
+            return
+
+        # Each pass places messages whose parent is already placed, so a
+        # thread is filled in from its root down, one level per pass at most
+        ready = pending.filter(Q(parent_message__isnull=True) | ~Q(parent_message__path=''))
+        updated = 0
+        skipped = []
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    ready.exclude(pk__in=skipped)
+                    .select_related('parent_message')
+                    .order_by('sent_at', 'message_id')[:batch_size]
+                )
+                if not batch:
+                    break
+                placed = []
+                for message in batch:
+                    try:
+                        message.set_thread_position(message.parent_message, message.sent_at)
+                    except ValidationError:
+                        skipped.append(message.pk)
+                        continue
+                    placed.append(message)
+                Message.objects.bulk_update(placed, ['thread_root', 'path', 'depth'])
+            updated += len(placed)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Backfilled {updated} messages')
+        )
+
+        remaining = pending.count()
+        if remaining:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'{remaining} messages are nested too deep to place in a thread'
+                )
+            )
@@ -0,0 +1,98 @@
+"""
+Which conversations the requesting user is an active participant of.
+
+The set of conversation ids is loaded once per request and kept on it, so
+permission checks and view querysets share one query.
+
+With MESSAGING_MEMBERSHIP_CACHE_TTL set, and a cache every worker shares
+(Redis, not the per-process LocMemCache), the set is also kept in the
+shared store for that many seconds. It is stored on the origin store,
+never in a near cache, under a per-user version that is bumped once a
+participation is added, removed or (de)activated. A request that loaded
+the set before such a change can therefore only write it under the old
+version, where nobody reads it any more.
+"""
+from django.conf import settings
+
+from .cache import bump_version, get_shared_cache, get_version
+from .models import ConversationParticipant
+
+MEMBERSHIP_VERSION_KEY = 'messaging:user:{user_id}:memberships:version'
+CONVERSATION_IDS_KEY = 'messaging:user:{user_id}:memberships:v{version}'
+REQUEST_ATTRIBUTE = '_messaging_conversation_ids'
+
+
+def membership_version_key(user_id):
+    return MEMBERSHIP_VERSION_KEY.format(user_id=user_id)
+
+
+def shared_membership_cache():
+    """The store to keep memberships in, or None when they are not shared"""
+    if not getattr(settings, 'MESSAGING_MEMBERSHIP_CACHE_TTL', 0):
+        return None
+    cache = get_shared_cache().origin
+    return cache if cache.is_cross_process else None
+
+
+def load_conversation_ids(user):
+    """Ids of the conversations the user is an active participant of"""
+    return frozenset(
+        ConversationParticipant.objects.filter(
+            user=user,
+            is_active=True
+        ).values_list('conversation_id', flat=True)
+    )
+
+
+def get_conversation_ids(request):
+    """load_conversation_ids() for the request's user, resolved once per request"""
+    # DRF wraps the HttpRequest; keep the ids on the inner one so the
+    # middleware, permissions and views all see the same copy
+    http_request = getattr(request, '_request', request)
+    conversation_ids = getattr(http_request, REQUEST_ATTRIBUTE, None)
+    if conversation_ids is not None:
+        return conversation_ids
+
+    user = request.user
+    cache = shared_membership_cache()
+    if cache is not None:
+        # The version is read before the database, see the module docstring
+        key = CONVERSATION_IDS_KEY.format(
+            user_id=user.pk,
+            version=get_version(membership_version_key(user.pk))
+        )
+        conversation_ids = cache.get(key)
+        if conversation_ids is None:
+            conversation_ids = load_conversation_ids(user)
+            cache.set(key, conversation_ids, settings.MESSAGING_MEMBERSHIP_CACHE_TTL)
+    else:
+        conversation_ids = load_conversation_ids(user)
+
+    setattr(http_request, REQUEST_ATTRIBUTE, conversation_ids)
+    return conversation_ids
+
+
+def member_conversations(request):
+    """
+    Value for pk__in / conversation_id__in filters: the request's ids when
+    they are already resolved or shared, otherwise a subquery, so list
+    views pay no separate membership query
+    """
+    http_request = getattr(request, '_request', request)
+    if hasattr(http_request, REQUEST_ATTRIBUTE) or shared_membership_cache() is not None:
+        return get_conversation_ids(request)
+    return ConversationParticipant.objects.filter(
+        user=request.user,
+        is_active=True
+    ).values('conversation_id')
+
+
+def is_participant(request, conversation_id):
+    """Whether the request's user is an active participant of the conversation"""
+    return conversation_id in get_conversation_ids(request)
+
+
+def invalidate_conversation_ids(user_id):
+    """Make the user's cached conversation ids unreachable after a membership change"""
+    if shared_membership_cache() is not None:
+        bump_version(membership_version_key(user_id))
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.1 on 2026-10-19 08:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    """Fill the denormalized counters from existing messages"""
+    Conversation = apps.get_model('messaging', 'Conversation')
+    ConversationParticipant = apps.get_model('messaging', 'ConversationParticipant')
+    Message = apps.get_model('messaging', 'Message')
+
+    for conversation in Conversation.objects.iterator():
+        messages = Message.objects.filter(conversation=conversation, is_deleted=False)
+        last_message = messages.order_by('-sent_at').first()
+        preview = ''
+        if last_message is not None:
+            if last_message.message_type != 'text':
+                preview = f"[{last_message.message_type}]"
+            elif len(last_message.message_body) > 100:
+                preview = last_message.message_body[:100] + "..."
+            else:
+                preview = last_message.message_body
+        Conversation.objects.filter(pk=conversation.pk).update(
+            last_message=last_message,
+            last_message_preview=preview,
+            message_count=messages.count()
+        )
+
+    unread = Message.objects.filter(
+        ~Q(sender=OuterRef('user')),
+        conversation=OuterRef('conversation'),
+        is_deleted=False,
+        sent_at__gt=OuterRef('last_read_at')
+    ).order_by().values('conversation').annotate(count=Count('pk')).values('count')
+    ConversationParticipant.objects.update(unread_count=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0005_remove_message_chats_message_read_deleted_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=103),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-19 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0007_message_cursor_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='is_coalesced',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_coalesced', True), ('is_read', False), ('notification_type', 'new_message')), fields=('recipient', 'related_conversation'), name='notifications_unread_new_message_uniq'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-19 08:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0008_notification_coalescing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagehistory',
+            name='edited_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='message_edits', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.1 on 2026-10-19 08:38
+
+from django.db import migrations, models
+
+
+def number_versions(apps, schema_editor):
+    """Number existing history entries per message, oldest first"""
+    MessageHistory = apps.get_model('messaging', 'MessageHistory')
+    current_message = None
+    entries = []
+    for entry in MessageHistory.objects.order_by('message_id', 'edited_at', 'history_id').iterator():
+        if entry.message_id != current_message:
+            current_message = entry.message_id
+            version = 0
+        version += 1
+        entry.version = version
+        entries.append(entry)
+        if len(entries) >= 1000:
+            MessageHistory.objects.bulk_update(entries, ['version'])
+            entries = []
+    MessageHistory.objects.bulk_update(entries, ['version'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_message_thread_path'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='messagehistory',
+            options={'ordering': ['-version'], 'verbose_name': 'Message History', 'verbose_name_plural': 'Message History'},
+        ),
+        migrations.AddField(
+            model_name='messagehistory',
+            name='delta',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='messagehistory',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='messagehistory',
+            name='previous_body',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(number_versions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='messagehistory',
+            constraint=models.UniqueConstraint(fields=('message', 'version'), name='message_history_version_uniq'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0011_message_history_deltas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='thread_root',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='thread_messages', to='messaging.message'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 
 from django.db import models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.conf import settings
 from django.dispatch import receiver
 from django.utils import timezone
@@ -67,6 +70,17 @@ class Conversation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+
+    # Denormalized from messages, maintained by messaging.signals
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    last_message_preview = models.CharField(max_length=103, blank=True, default='')
+    message_count = models.PositiveIntegerField(default=0)
     
     class Meta:
         db_table = 'conversations'
@@ -85,17 +99,34 @@ class Conversation(models.Model):
     
     def get_last_message(self):
         """Get the most recent message in this conversation"""
-        return self.messages.first()
+        return self.last_message
     
     def get_unread_count(self, user):
         """Get unread message count for a specific user"""
-        try:
-            participant = self.conversation_participants.get(user=user)
-            return self.messages.filter(
-                sent_at__gt=participant.last_read_at
-            ).exclude(sender=user).count()
-        except ConversationParticipant.DoesNotExist:
-            return 0
+        participant = self.conversation_participants.filter(user=user).only('unread_count').first()
+        return participant.unread_count if participant else 0
+
+    def refresh_counters(self):
+        """
+        Recompute last_message, message_count and every participant's
+        unread_count from the messages table
+        """
+        messages = Message.objects.filter(conversation=self, is_deleted=False)
+        last_message = messages.order_by('-sent_at').first()
+        Conversation.objects.filter(pk=self.pk).update(
+            last_message=last_message,
+            last_message_preview=last_message.get_preview() if last_message else '',
+            message_count=messages.count()
+        )
+        unread = Message.objects.filter(
+            ~Q(sender=OuterRef('user')),
+            conversation=OuterRef('conversation'),
+            is_deleted=False,
+            sent_at__gt=OuterRef('last_read_at')
+        ).order_by().values('conversation').annotate(count=Count('pk')).values('count')
+        ConversationParticipant.objects.filter(conversation=self).update(
+            unread_count=Coalesce(Subquery(unread), 0)
+        )
 
 
 class ConversationParticipant(models.Model):
@@ -122,6 +153,7 @@ class ConversationParticipant(models.Model):
     role = models.CharField(max_length=10, choices=PARTICIPANT_ROLES, default='member')
     joined_at = models.DateTimeField(auto_now_add=True)
     last_read_at = models.DateTimeField(default=timezone.now)
+    unread_count = models.PositiveIntegerField(default=0)
     is_muted = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
     
@@ -137,7 +169,8 @@ class ConversationParticipant(models.Model):
     def mark_as_read(self):
         """Mark all messages as read up to now"""
         self.last_read_at = timezone.now()
-        self.save(update_fields=['last_read_at'])
+        self.unread_count = 0
+        self.save(update_fields=['last_read_at', 'unread_count'])
 
 class Message(models.Model):
     """
@@ -151,6 +184,11 @@ class Message(models.Model):
         ('video', 'Video'),
         ('system', 'System Message'),
     ]
+    # Path segments are 13 hex digits of microseconds plus 7 of the id,
+    # so sorting on path lists a thread depth first, oldest replies first
+    PATH_SEPARATOR = '.'
+    PATH_SUBTREE_END = '/'
+    MAX_THREAD_DEPTH = 45
     
     message_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     conversation = models.ForeignKey(
@@ -188,6 +226,22 @@ class Message(models.Model):
 )
     is_read = models.BooleanField(default=False)
 
+    # Denormalized thread position, set once on insert: the thread's first
+    # message, and the chain of path segments from it down to this message.
+    # thread_root only groups the thread, so it keeps pointing at a root
+    # that was hard deleted instead of merging the thread into the NULL
+    # bucket of messages not placed yet.
+    thread_root = models.ForeignKey(
+        'self',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='thread_messages'
+    )
+    path = models.CharField(max_length=1024, blank=True, default='')
+    depth = models.PositiveSmallIntegerField(default=0)
+
     objects = models.Manager() 
     unread = UnreadMessagesManager()
 
@@ -203,7 +257,24 @@ class Message(models.Model):
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
         ordering = ['-sent_at']  # Updated to use 'sent_at'
+        indexes = [
+            # Keyset pagination seeks on (sent_at, message_id) per conversation
+            models.Index(
+                fields=['conversation', 'sent_at', 'message_id'],
+                name='messages_conv_sent_id_idx'
+            ),
+            # Thread and subtree fetches are prefix ranges on path
+            models.Index(fields=['thread_root', 'path'], name='messages_thread_path_idx'),
+        ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Values as loaded, so the edit signal can compare against them
+        # instead of fetching the row again before every save
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self):
         if self.message_type == 'text':
             preview = self.message_body[:50] + "..." if len(self.message_body) > 50 else self.message_body
@@ -211,6 +282,68 @@ class Message(models.Model):
         else:
             return f"{self.sender.username}: [{self.message_type}]"
     
+    def get_preview(self, length=100):
+        """Short text shown in conversation lists and notifications"""
+        if self.message_type != 'text':
+            return f"[{self.message_type}]"
+        if len(self.message_body) > length:
+            return self.message_body[:length] + "..."
+        return self.message_body
+
+    def path_segment(self, when):
+        """This message's part of the thread path, ordered by `when`"""
+        micros = int(when.timestamp() * 1_000_000)
+        return f"{micros:013x}{self.pk.hex[:7]}"
+
+    def set_thread_position(self, parent, when):
+        """
+        Place the message in its thread below `parent` (None for a thread's
+        first message); `parent` must already have its own position
+        """
+        segment = self.path_segment(when)
+        if parent is None:
+            self.thread_root_id = self.pk
+            self.path = segment
+            self.depth = 0
+            return
+        if parent.depth >= self.MAX_THREAD_DEPTH:
+            raise ValidationError(f"Replies cannot be nested more than {self.MAX_THREAD_DEPTH} levels deep")
+        self.thread_root_id = parent.thread_root_id
+        self.path = f"{parent.path}{self.PATH_SEPARATOR}{segment}"
+        self.depth = parent.depth + 1
+
+    def get_thread(self):
+        """
+        Every message of this message's thread, in thread order. Messages
+        not placed by backfill_message_threads yet only get themselves and
+        their replies, in the order sent.
+        """
+        if not self.path:
+            from messaging.utils.threads import thread_queryset
+            return thread_queryset(self).order_by('sent_at', 'message_id')
+        return Message.objects.filter(thread_root_id=self.thread_root_id).order_by('path')
+
+    def get_subtree_path_range(self):
+        """
+        Bounds of the paths of this message and every reply below it.
+        A plain range rather than startswith, which compiles to LIKE and
+        cannot seek on the (thread_root, path) index; PATH_SUBTREE_END
+        sorts right after the separator and before every segment digit.
+        """
+        return self.path, f"{self.path}{self.PATH_SUBTREE_END}"
+
+    def get_descendants(self):
+        """Replies at any depth below this message, in thread order"""
+        if not self.path:
+            from messaging.utils.threads import thread_queryset
+            return thread_queryset(self).exclude(pk=self.pk).order_by('sent_at', 'message_id')
+        start, end = self.get_subtree_path_range()
+        return Message.objects.filter(
+            thread_root_id=self.thread_root_id,
+            path__gt=start,
+            path__lt=end
+        ).order_by('path')
+
     def mark_as_edited(self):
         """Mark message as edited"""
         self.is_edited = True
@@ -316,6 +449,11 @@ class Notification(models.Model):
         related_name='notifications'
     )
     
+    # Set when written with NOTIFICATION_COALESCING on; count is the number
+    # of messages folded into this notification
+    is_coalesced = models.BooleanField(default=False)
+    count = models.PositiveIntegerField(default=1)
+
     is_read = models.BooleanField(default=False)
     is_sent = models.BooleanField(default=False)
     read_at = models.DateTimeField(null=True, blank=True)
@@ -331,6 +469,15 @@ class Notification(models.Model):
             models.Index(fields=['recipient', '-created_at']),
             models.Index(fields=['recipient', 'is_read']),
         ]
+        constraints = [
+            # At most one unread coalesced new_message notification per
+            # recipient and conversation; fan-out upserts use it as conflict target
+            models.UniqueConstraint(
+                fields=['recipient', 'related_conversation'],
+                condition=models.Q(notification_type='new_message', is_read=False, is_coalesced=True),
+                name='notifications_unread_new_message_uniq'
+            ),
+        ]
     
     def __str__(self):
         return f"Notification for {self.recipient.username}: {self.title}"
@@ -355,14 +502,28 @@ class MessageHistory(models.Model):
     """
     history_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     message = models.ForeignKey('Message', on_delete=models.CASCADE, related_name='history')
-    previous_body = models.TextField()
+    # 1 for a message's first edit, then counting up
+    version = models.PositiveIntegerField(default=1)
+    # Full text, or empty when stored as a delta (see messaging.history)
+    previous_body = models.TextField(blank=True)
+    delta = models.JSONField(null=True, blank=True)
     edited_at = models.DateTimeField(auto_now_add=True)
+    edited_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='message_edits'
+    )
 
     class Meta:
         db_table = 'message_history'
         verbose_name = 'Message History'
         verbose_name_plural = 'Message History'
-        ordering = ['-edited_at']
+        ordering = ['-version']
+        constraints = [
+            models.UniqueConstraint(fields=['message', 'version'], name='message_history_version_uniq'),
+        ]
 
     def __str__(self):
         return f"Edit history for message {self.message.message_id}"
\ No newline at end of file
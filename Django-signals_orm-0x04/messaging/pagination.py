@@ -1,6 +1,130 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 class MessagePagination(PageNumberPagination):
     page_size = 20
-    page_size_query_param = 'page_size' 
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination over (sent_at, message_id), newest first.
+
+    `?before=<cursor>` walks back to older messages and `?after=<cursor>`
+    forward to newer ones, each as a range seek on the
+    (conversation, sent_at, message_id) index, so deep pages cost the
+    same as the first and new messages never shift a page.
+    """
+    page_size = 50
+    page_size_query_param = 'limit'
     max_page_size = 100
+    before_query_param = 'before'
+    after_query_param = 'after'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        before = self.decode_cursor(request.query_params.get(self.before_query_param))
+        after = self.decode_cursor(request.query_params.get(self.after_query_param))
+
+        if after:
+            sent_at, message_id = after
+            rows = list(queryset.filter(
+                Q(sent_at__gt=sent_at) | Q(sent_at=sent_at, message_id__gt=message_id)
+            ).order_by('sent_at', 'message_id')[:self.page_size + 1])
+            self.has_newer = len(rows) > self.page_size
+            # The cursor row may since have been deleted, so look rather
+            # than assume there is something at or before it
+            self.has_older = queryset.filter(
+                Q(sent_at__lt=sent_at) | Q(sent_at=sent_at, message_id__lte=message_id)
+            ).exists()
+            rows = rows[:self.page_size]
+            rows.reverse()
+        else:
+            self.has_newer = False
+            if before:
+                sent_at, message_id = before
+                # Same as has_older above: the cursor row may be the
+                # newest one, or deleted since
+                self.has_newer = queryset.filter(
+                    Q(sent_at__gt=sent_at) | Q(sent_at=sent_at, message_id__gte=message_id)
+                ).exists()
+                queryset = queryset.filter(
+                    Q(sent_at__lt=sent_at) | Q(sent_at=sent_at, message_id__lt=message_id)
+                )
+            rows = list(queryset.order_by('-sent_at', '-message_id')[:self.page_size + 1])
+            self.has_older = len(rows) > self.page_size
+            rows = rows[:self.page_size]
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, message):
+        raw = f"{message.sent_at.isoformat()}|{message.message_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+            sent_at, message_id = raw.split('|')
+            sent_at = parse_datetime(sent_at)
+            message_id = uuid.UUID(message_id)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if sent_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return sent_at, message_id
+
+    def get_link(self, param, message):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.before_query_param)
+        url = remove_query_param(url, self.after_query_param)
+        return replace_query_param(url, param, self.encode_cursor(message))
+
+    def get_next_link(self):
+        """Older messages"""
+        if not self.page or not self.has_older:
+            return None
+        return self.get_link(self.before_query_param, self.page[-1])
+
+    def get_previous_link(self):
+        """Newer messages"""
+        if not self.page or not self.has_newer:
+            return None
+        return self.get_link(self.after_query_param, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -1,5 +1,5 @@
 from rest_framework import permissions
-from .models import ConversationParticipant
+from .membership import is_participant
 
 class IsParticipant(permissions.BasePermission):
     """
@@ -15,18 +15,15 @@ class IsParticipant(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         """
         Object-level permission:
-        Checks if user is an active participant in the conversation.
+        Checks if user is an active participant in the conversation,
+        against the memberships resolved once for the request.
         """
 
-        if hasattr(obj, 'conversation'):
-            conversation = obj.conversation
-        elif hasattr(obj, 'conversation_participants'):
-            conversation = obj
+        if hasattr(obj, 'conversation_participants'):
+            conversation_id = obj.pk
+        elif hasattr(obj, 'conversation'):
+            conversation_id = obj.conversation_id
         else:
             return False
 
-        return ConversationParticipant.objects.filter(
-            conversation=conversation,
-            user=request.user,
-            is_active=True
-        ).exists()
+        return is_participant(request, conversation_id)
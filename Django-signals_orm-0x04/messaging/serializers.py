@@ -3,6 +3,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from .history import history_bodies
 from .models import MessageHistory, User, Conversation, ConversationParticipant, Message, MessageReaction
 
 User = get_user_model()
@@ -60,7 +61,7 @@ class UserMinimalSerializer(serializers.ModelSerializer):
     """
     Minimal User serializer for nested relationships (reduces payload size)
     """
-    full_name = serializers.SerializerMethodField()
+    full_name = serializers.CharField(read_only=True)
     
     class Meta:
         model = User
@@ -74,7 +75,7 @@ class UserMinimalSerializer(serializers.ModelSerializer):
         data = super().to_representation(instance)
         
 
-        full_name = instance.get_field_names()
+        full_name = instance.get_full_name()
         data['full_name'] = full_name if full_name.strip() else instance.username
         
         return data
@@ -187,7 +188,7 @@ class MessageCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = [
-            'message_type', 'message_body', 'file_attachment', 'reply_to'
+            'message_type', 'message_body', 'file_attachment', 'parent_message'
         ]
     
     def validate(self, data):
@@ -195,12 +196,18 @@ class MessageCreateSerializer(serializers.ModelSerializer):
         message_type = data.get('message_type', 'text')
         message_body = data.get('message_body', '')
         file_attachment = data.get('file_attachment')
+        parent_message = data.get('parent_message')
 
         if message_type == 'text' and not message_body.strip():
             raise serializers.ValidationError("Text messages cannot be empty.")
 
         if message_type in ['image', 'file', 'audio', 'video'] and not file_attachment:
             raise serializers.ValidationError(f"{message_type.title()} messages must include a file attachment.")
+
+        if parent_message is not None and parent_message.depth >= Message.MAX_THREAD_DEPTH:
+            raise serializers.ValidationError(
+                f"Replies cannot be nested more than {Message.MAX_THREAD_DEPTH} levels deep."
+            )
         
         return data
 
@@ -210,7 +217,6 @@ class ConversationParticipantSerializer(serializers.ModelSerializer):
     Serializer for conversation participants
     """
     user = UserMinimalSerializer(read_only=True)
-    unread_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = ConversationParticipant
@@ -218,21 +224,8 @@ class ConversationParticipantSerializer(serializers.ModelSerializer):
             'id', 'user', 'role', 'joined_at', 'last_read_at', 
             'is_muted', 'is_active', 'unread_count'
         ]
-        read_only_fields = ['id', 'joined_at']
+        read_only_fields = ['id', 'joined_at', 'unread_count']
     
-    def to_representation(self, instance):
-        """
-        Override to populate computed fields
-        """
-        data = super().to_representation(instance)
-        
-
-        data['unread_count'] = instance.conversation.messages.filter(
-            sent_at__gt=instance.last_read_at,
-            is_deleted=False
-        ).exclude(sender=instance.user).count()
-        
-        return data
 
 
 class ConversationSerializer(serializers.ModelSerializer):
@@ -245,7 +238,7 @@ class ConversationSerializer(serializers.ModelSerializer):
         read_only=True
     )
     created_by = UserMinimalSerializer(read_only=True)
-    last_message = serializers.DictField(read_only=True, allow_null=True)
+    last_message = serializers.SerializerMethodField()
     unread_count = serializers.IntegerField(read_only=True)
     participant_count = serializers.IntegerField(read_only=True)
     display_name = serializers.CharField(read_only=True)
@@ -256,11 +249,28 @@ class ConversationSerializer(serializers.ModelSerializer):
         fields = [
             'conversation_id', 'title', 'conversation_type', 'participants',
             'created_by', 'created_at', 'updated_at', 'is_active',
-            'last_message', 'unread_count', 'participant_count',
+            'last_message', 'message_count', 'unread_count', 'participant_count',
             'display_name', 'display_image'
         ]
-        read_only_fields = ['conversation_id', 'created_at', 'updated_at']
+        read_only_fields = ['conversation_id', 'created_at', 'updated_at', 'message_count']
     
+    def get_last_message(self, instance):
+        """
+        Last message, read from the fields denormalized onto the
+        conversation by messaging.signals
+        """
+        last_message = instance.last_message
+        if not last_message:
+            return None
+        return {
+            'message_id': last_message.message_id,
+            'sender': UserMinimalSerializer(last_message.sender).data,
+            'message_type': last_message.message_type,
+            'message_body': instance.last_message_preview,
+            'sent_at': last_message.sent_at,
+            'is_deleted': last_message.is_deleted
+        }
+
     def to_representation(self, instance):
         """
         Override to populate all computed fields for conversations
@@ -268,32 +278,36 @@ class ConversationSerializer(serializers.ModelSerializer):
         data = super().to_representation(instance)
         request = self.context.get('request')
 
-        last_message = instance.get_last_message()
-        if last_message:
-            data['last_message'] = {
-                'message_id': last_message.message_id,
-                'sender': UserMinimalSerializer(last_message.sender).data,
-                'message_type': last_message.message_type,
-                'message_body': last_message.message_body[:100] + "..." if len(last_message.message_body) > 100 else last_message.message_body,
-                'sent_at': last_message.sent_at,
-                'is_deleted': last_message.is_deleted
-            }
-        else:
-            data['last_message'] = None
-        
+        # ConversationViewSet annotates these for list and detail views;
+        # fall back to the prefetch-friendly lookups elsewhere
+        participants = instance.conversation_participants.all()
 
-        if request and request.user.is_authenticated:
-            data['unread_count'] = instance.get_unread_count(request.user)
+        if hasattr(instance, 'user_unread_count'):
+            data['unread_count'] = instance.user_unread_count or 0
         else:
             data['unread_count'] = 0
-        
+            if request and request.user.is_authenticated:
+                for participant in participants:
+                    if participant.user_id == request.user.pk:
+                        data['unread_count'] = participant.unread_count
+                        break
+
+        if hasattr(instance, 'active_participant_count'):
+            data['participant_count'] = instance.active_participant_count
+        else:
+            data['participant_count'] = sum(1 for participant in participants if participant.is_active)
 
-        data['participant_count'] = instance.conversation_participants.filter(is_active=True).count()
+        other_participant = None
+        if request and request.user.is_authenticated and instance.conversation_type == 'direct':
+            if hasattr(instance, 'other_participants'):
+                others = instance.other_participants
+            else:
+                others = [p for p in participants if p.user_id != request.user.pk]
+            other_participant = others[0].user if others else None
 
         if instance.conversation_type == 'group' and instance.title:
             data['display_name'] = instance.title
         elif request and request.user.is_authenticated and instance.conversation_type == 'direct':
-            other_participant = instance.participants.exclude(user_id=request.user.user_id).first()
             if other_participant:
                 full_name = other_participant.get_full_name()
                 data['display_name'] = full_name if full_name.strip() else other_participant.username
@@ -304,7 +318,6 @@ class ConversationSerializer(serializers.ModelSerializer):
         
 
         if request and request.user.is_authenticated and instance.conversation_type == 'direct':
-            other_participant = instance.participants.exclude(user_id=request.user.user_id).first()
             if other_participant and other_participant.profile_picture:
                 data['display_image'] = request.build_absolute_uri(other_participant.profile_picture.url)
             else:
@@ -430,10 +443,31 @@ class MessageReactionCreateSerializer(serializers.ModelSerializer):
             **validated_data
         )
 
+class MessageHistoryListSerializer(serializers.ListSerializer):
+    """
+    Rebuilds the previous_body of every entry once for the whole list,
+    so each delta is applied a single time
+    """
+
+    def to_representation(self, data):
+        entries = list(data.all() if hasattr(data, 'all') else data)
+        self.bodies = history_bodies(entries)
+        return super().to_representation(entries)
+
+
 class MessageHistorySerializer(serializers.ModelSerializer):
+    previous_body = serializers.SerializerMethodField()
+
     class Meta:
         model = MessageHistory
         fields = ['previous_body', 'edited_at']
+        list_serializer_class = MessageHistoryListSerializer
+
+    def get_previous_body(self, obj):
+        bodies = getattr(self.parent, 'bodies', None)
+        if bodies is None or obj.pk not in bodies:
+            bodies = history_bodies([obj])
+        return bodies[obj.pk]
 
 class MessageSerializer(serializers.ModelSerializer):
     history = MessageHistorySerializer(many=True, read_only=True)
@@ -1,117 +1,277 @@
-from datetime import timezone
-from django.db.models.signals import post_save, pre_save
+import re
+import threading
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
+from messaging.cache import bump_conversation_version
+from messaging.history import detach_history_entry, record_edit
+from messaging.membership import invalidate_conversation_ids
+from messaging.tasks import fan_out_message_notifications
 from messaging.utils.thread_local import get_current_user
-from .models import Message, Notification, ConversationParticipant, MessageHistory
+from .models import Conversation, Message, MessageHistory, MessageReaction, Notification, ConversationParticipant
 
 User = get_user_model()
 
+# Set on a message by log_message_edit
+EDIT_FIELDS = ('is_edited', 'edited_at', 'edited_by')
+
+
+@receiver(post_save, sender=Message)
+def update_conversation_counters(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep the denormalized last_message, message_count and unread_count
+    fields in step with the conversation's messages
+    """
+    if created:
+        if instance.is_deleted:
+            return
+        with transaction.atomic():
+            Conversation.objects.filter(pk=instance.conversation_id).update(
+                last_message=instance,
+                last_message_preview=instance.get_preview(),
+                message_count=F('message_count') + 1
+            )
+            ConversationParticipant.objects.filter(
+                conversation_id=instance.conversation_id
+            ).exclude(user_id=instance.sender_id).update(
+                unread_count=F('unread_count') + 1
+            )
+        return
+
+    # Soft deletes go through save(update_fields=[..., 'is_deleted', ...])
+    if update_fields and 'is_deleted' in update_fields:
+        with transaction.atomic():
+            instance.conversation.refresh_counters()
+    elif update_fields is None or 'message_body' in update_fields:
+        Conversation.objects.filter(
+            pk=instance.conversation_id,
+            last_message=instance
+        ).update(last_message_preview=instance.get_preview())
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def invalidate_message_pages(sender, instance, **kwargs):
+    """
+    Bump the conversation's cache version once the change is committed, so
+    no reader can cache the old rows under the new version
+    """
+    conversation_id = instance.conversation_id
+    transaction.on_commit(lambda: bump_conversation_version(conversation_id))
+
+
+@receiver(post_save, sender=MessageReaction)
+@receiver(post_delete, sender=MessageReaction)
+def invalidate_message_pages_on_reaction(sender, instance, **kwargs):
+    """Reactions are part of the cached message pages too"""
+    conversation_id = Message.objects.filter(
+        pk=instance.message_id
+    ).values_list('conversation_id', flat=True).first()
+    if conversation_id:
+        transaction.on_commit(lambda: bump_conversation_version(conversation_id))
+
+
+# Conversations waiting to be recounted after a bulk delete, per thread
+_pending_counter_refresh = threading.local()
+
+
+def _refresh_pending_counters():
+    conversation_ids = getattr(_pending_counter_refresh, 'conversation_ids', set())
+    _pending_counter_refresh.conversation_ids = set()
+    for conversation in Conversation.objects.filter(pk__in=conversation_ids):
+        with transaction.atomic():
+            conversation.refresh_counters()
+
+
+@receiver(post_delete, sender=Message)
+def refresh_counters_on_delete(sender, instance, origin=None, **kwargs):
+    """
+    Recount after a hard delete, unless the whole conversation is going.
+    Deleting one message recounts right away; deletes of many at once
+    (a queryset, or a cascade from their sender) recount each affected
+    conversation once, after commit.
+    """
+    if isinstance(origin, Conversation):
+        return
+    if origin is instance:
+        with transaction.atomic():
+            conversation = Conversation.objects.filter(pk=instance.conversation_id).first()
+            if conversation:
+                conversation.refresh_counters()
+        return
+
+    if not hasattr(_pending_counter_refresh, 'conversation_ids'):
+        _pending_counter_refresh.conversation_ids = set()
+    _pending_counter_refresh.conversation_ids.add(instance.conversation_id)
+    # Every message registers the callback, so ids left by a rolled back
+    # delete are still flushed; all but the first find nothing to do
+    transaction.on_commit(_refresh_pending_counters)
+
+
+@receiver(post_save, sender=ConversationParticipant)
+@receiver(post_delete, sender=ConversationParticipant)
+def invalidate_membership_cache(sender, instance, update_fields=None, **kwargs):
+    """
+    Joining or leaving changes the user's cached conversation ids; saves
+    that only touch read state (mark_as_read) do not
+    """
+    if update_fields is not None and 'is_active' not in update_fields:
+        return
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_conversation_ids(user_id))
+
+
 @receiver(post_save, sender=Message)
 def create_message_notifications(sender, instance, created, **kwargs):
     """
-    Notifications for all conversation participants when a new message is sent or created
+    Notifications for all conversation participants when a new message is sent or created.
+    The fan-out runs as a Celery task once the message is committed, so the
+    request does not wait on it however large the conversation is.
     """
     if not created or instance.message_type == 'system': 
         return
-    
-    participants = ConversationParticipant.objects.filter(
-        conversation=instance.conversation,
-        is_active=True
-    ).exclude(user=instance.sender)
-    
-    notifications_to_create = []
-    
-    for participant in participants:
-        if participant.is_muted:
-            continue
-            
-        if instance.conversation.conversation_type == 'group':
-            title = f"New message in {instance.conversation.title or 'Group Chat'}"
-        else:
-            title = f"New message from {instance.sender.get_full_name() or instance.sender.username}"
 
-        if instance.message_type == 'text':
-            message_preview = instance.message_body[:100] + "..." if len(instance.message_body) > 100 else instance.message_body
-        else:
-            message_preview = f"Sent a {instance.get_message_type_display().lower()}"
-        
-        notification = Notification(
-            recipient=participant.user,
-            sender=instance.sender,
-            notification_type='new_message',
-            title=title,
-            message=message_preview,
-            related_message=instance,
-            related_conversation=instance.conversation
-        )
-        notifications_to_create.append(notification)
-    
-    if notifications_to_create:
-        Notification.objects.bulk_create(notifications_to_create)
+    message_id = instance.pk
+    transaction.on_commit(lambda: fan_out_message_notifications.delay(message_id))
+
+
+# "@name" not preceded by a word character (so emails are skipped);
+# usernames may contain letters, digits and @ . + - _
+MENTION_PATTERN = re.compile(r'(?<![\w@])@([\w.@+-]+)')
+
+
+def extract_mentions(text):
+    """Unique usernames mentioned in a message body, in order of appearance"""
+    usernames = (match.rstrip('.') for match in MENTION_PATTERN.findall(text))
+    return list(dict.fromkeys(username for username in usernames if username))
 
 
 @receiver(post_save, sender=Message)
 def handle_message_mentions(sender, instance, created, **kwargs):
     """
-    Special notifications for mentioned users in messages
+    Special notifications for mentioned users in messages.
+    Mentions are resolved against the conversation's active participants
+    in a single query, whatever their number.
     """
     if not created or instance.message_type != 'text':
         return
-    
-    words = instance.message_body.split()
-    mentions = []
-    
-    for word in words:
-        if word.startswith('@') and len(word) > 1:
-            username = word[1:].strip('.,!?;:')
-            try:
-                mentioned_user = User.objects.get(username=username)
-                if mentioned_user != instance.sender:
-                    mentions.append(mentioned_user)
-            except User.DoesNotExist:
-                continue
-    
-    mention_notifications = []
-    for mentioned_user in mentions:
-        is_participant = ConversationParticipant.objects.filter(
-            conversation=instance.conversation,
-            user=mentioned_user,
-            is_active=True
-        ).exists()
-        
-        if is_participant:
-            notification = Notification(
-                recipient=mentioned_user,
-                sender=instance.sender,
-                notification_type='mention',
-                title=f"You were mentioned by {instance.sender.get_full_name() or instance.sender.username}",
-                message=f"In: {instance.message_body[:100]}...",
-                related_message=instance,
-                related_conversation=instance.conversation
-            )
-            mention_notifications.append(notification)
-    
-    if mention_notifications:
-        Notification.objects.bulk_create(mention_notifications)
+
+    usernames = extract_mentions(instance.message_body)
+    if not usernames:
+        return
+
+    mentioned_user_ids = ConversationParticipant.objects.filter(
+        conversation_id=instance.conversation_id,
+        is_active=True,
+        user__username__in=usernames
+    ).exclude(user_id=instance.sender_id).values_list('user_id', flat=True).distinct()
+
+    title = f"You were mentioned by {instance.sender.get_full_name() or instance.sender.username}"
+    Notification.objects.bulk_create([
+        Notification(
+            recipient_id=user_id,
+            sender_id=instance.sender_id,
+            notification_type='mention',
+            title=title,
+            message=f"In: {instance.message_body[:100]}...",
+            related_message=instance,
+            related_conversation_id=instance.conversation_id
+        )
+        for user_id in mentioned_user_ids
+    ])
+
 
 @receiver(pre_save, sender=Message)
-def log_message_edit(sender, instance, **kwargs):
-    if not instance.pk:
+def set_message_thread_position(sender, instance, raw=False, **kwargs):
+    """
+    Fill in thread_root, path and depth of new messages from their parent
+    """
+    if raw or not instance._state.adding or instance.path:
         return
 
-    try:
-        original = Message.objects.get(pk=instance.pk)
-    except Message.DoesNotExist:
+    parent = None
+    if instance.parent_message_id:
+        if Message.parent_message.is_cached(instance):
+            parent = instance.parent_message
+        else:
+            parent = Message.objects.only('thread_root', 'path', 'depth').get(pk=instance.parent_message_id)
+        if not parent.path:
+            # Parent predates the thread fields; backfill_message_threads
+            # places both of them
+            return
+    instance.set_thread_position(parent, timezone.now())
+
+
+@receiver(pre_save, sender=Message)
+def log_message_edit(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep the previous body in MessageHistory when a message is edited.
+    The previous body comes from the snapshot taken in Message.from_db;
+    saves that leave message_body out of update_fields are skipped.
+    save_message_edit finishes the edit once the save went through.
+    """
+    if instance._state.adding:
+        return
+    if update_fields is not None and 'message_body' not in update_fields:
         return
 
-    if original.message_body != instance.message_body:
-        MessageHistory.objects.create(
-            message=original,
-            previous_body=original.message_body,
-            edited_by=get_current_user()
-        )
-        instance.is_edited = True
-        instance.edited_at = timezone.now()
-        instance.edited_by = get_current_user()
\ No newline at end of file
+    loaded_values = getattr(instance, '_loaded_values', {})
+    if 'message_body' in loaded_values:
+        previous_body = loaded_values['message_body']
+    else:
+        # Built by hand or loaded with message_body deferred
+        previous_body = Message.objects.filter(
+            pk=instance.pk
+        ).values_list('message_body', flat=True).first()
+        if previous_body is None:
+            return
+
+    if previous_body == instance.message_body:
+        return
+
+    editor = get_current_user()
+    if editor is not None and not editor.is_authenticated:
+        editor = None
+
+    record_edit(instance, previous_body, editor)
+    instance.is_edited = True
+    instance.edited_at = timezone.now()
+    instance.edited_by = editor
+    instance._edit_pending = True
+
+
+@receiver(post_save, sender=Message)
+def save_message_edit(sender, instance, created, update_fields=None, **kwargs):
+    """
+    After an edit is saved, write the edit fields a save with update_fields
+    left out, and move the from_db snapshot on to the saved body. Until
+    then a failed save still compares against the old body.
+    """
+    if created or not getattr(instance, '_edit_pending', False):
+        return
+    del instance._edit_pending
+
+    if update_fields is not None:
+        missing = [name for name in EDIT_FIELDS if name not in update_fields]
+        if missing:
+            Message.objects.filter(pk=instance.pk).update(
+                **{name: getattr(instance, name) for name in missing}
+            )
+    if hasattr(instance, '_loaded_values'):
+        instance._loaded_values['message_body'] = instance.message_body
+
+
+@receiver(pre_delete, sender=MessageHistory)
+def keep_history_readable_on_delete(sender, instance, origin=None, **kwargs):
+    """
+    Older history entries may be deltas against the one being deleted.
+    Only deletes of history entries themselves need this; in a cascade
+    from a message or conversation all of a message's entries go together.
+    """
+    if not (isinstance(origin, MessageHistory) or getattr(origin, 'model', None) is MessageHistory):
+        return
+    detach_history_entry(instance)
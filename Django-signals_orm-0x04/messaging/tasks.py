@@ -0,0 +1,143 @@
+from itertools import islice
+
+from celery import shared_task
+from django.conf import settings
+from django.db import connections
+
+from .models import ConversationParticipant, Message, Notification
+
+# Inserts coalesced notifications, or folds them into the recipient's
+# unread one. The conflict target repeats the condition of the partial
+# unique constraint notifications_unread_new_message_uniq.
+COALESCED_UPSERT_SQL = """
+INSERT INTO {table} ({columns}) VALUES {rows}
+ON CONFLICT ({recipient}, {conversation})
+WHERE ({is_coalesced} AND NOT {is_read} AND {notification_type} = 'new_message')
+DO UPDATE SET {count} = {table}.{count} + 1, {updates}
+"""
+
+# Copied from the newest message into a coalesced notification
+COALESCED_UPDATE_FIELDS = ('sender', 'title', 'message', 'related_message', 'created_at')
+
+
+def _chunks(iterable, size):
+    """Yield lists of up to `size` items"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def new_message_title(message):
+    """Notification title for a new message"""
+    if message.conversation.conversation_type == 'group':
+        return f"New message in {message.conversation.title or 'Group Chat'}"
+    return f"New message from {message.sender.get_full_name() or message.sender.username}"
+
+
+def new_message_preview(message):
+    """Notification body for a new message"""
+    if message.message_type == 'text':
+        return message.get_preview()
+    return f"Sent a {message.get_message_type_display().lower()}"
+
+
+def upsert_coalesced_notifications(notifications):
+    """
+    Write coalesced new_message notifications in one statement per batch,
+    so concurrent fan-outs for one conversation never lose a count
+
+    Returns:
+        int: Number of notifications inserted or updated
+    """
+    connection = connections[Notification.objects.db]
+    quote = connection.ops.quote_name
+    opts = Notification._meta
+    fields = opts.concrete_fields
+    column = {field.name: quote(field.column) for field in fields}
+    batch_size = max(connection.ops.bulk_batch_size(fields, notifications), 1)
+    row = '({})'.format(', '.join(['%s'] * len(fields)))
+
+    written = 0
+    with connection.cursor() as cursor:
+        for batch in _chunks(notifications, batch_size):
+            sql = COALESCED_UPSERT_SQL.format(
+                table=quote(opts.db_table),
+                columns=', '.join(column[field.name] for field in fields),
+                rows=', '.join([row] * len(batch)),
+                recipient=column['recipient'],
+                conversation=column['related_conversation'],
+                is_coalesced=column['is_coalesced'],
+                is_read=column['is_read'],
+                notification_type=column['notification_type'],
+                count=column['count'],
+                updates=', '.join(
+                    f'{column[name]} = EXCLUDED.{column[name]}' for name in COALESCED_UPDATE_FIELDS
+                )
+            )
+            params = [
+                field.get_db_prep_save(field.pre_save(notification, True), connection)
+                for notification in batch
+                for field in fields
+            ]
+            cursor.execute(sql, params)
+            written += cursor.rowcount
+    return written
+
+
+@shared_task
+def fan_out_message_notifications(message_id):
+    """
+    Create a new_message notification for every active, unmuted
+    participant of the message's conversation except its sender.
+
+    Recipients are streamed from the database as user ids and written
+    NOTIFICATION_BATCH_SIZE at a time, so memory stays flat however
+    large the group is.
+
+    With NOTIFICATION_COALESCING on, each recipient keeps a single unread
+    new_message notification per conversation: existing ones get their
+    count bumped and the latest preview, in the same statement that
+    inserts rows for recipients without one.
+
+    Returns:
+        int: Number of recipients notified
+    """
+    message = Message.objects.select_related('sender', 'conversation').filter(
+        pk=message_id,
+        is_deleted=False
+    ).first()
+    if message is None:
+        return 0
+
+    batch_size = settings.NOTIFICATION_BATCH_SIZE
+    title = new_message_title(message)
+    preview = new_message_preview(message)
+    recipient_ids = ConversationParticipant.objects.filter(
+        conversation_id=message.conversation_id,
+        is_active=True,
+        is_muted=False
+    ).exclude(user_id=message.sender_id).values_list('user_id', flat=True)
+
+    coalesce = settings.NOTIFICATION_COALESCING
+
+    notified = 0
+    for chunk in _chunks(recipient_ids.iterator(chunk_size=batch_size), batch_size):
+        notifications = [
+            Notification(
+                recipient_id=recipient_id,
+                sender_id=message.sender_id,
+                notification_type='new_message',
+                title=title,
+                message=preview,
+                related_message_id=message.pk,
+                related_conversation_id=message.conversation_id,
+                is_coalesced=coalesce
+            )
+            for recipient_id in chunk
+        ]
+        if coalesce:
+            notified += upsert_coalesced_notifications(notifications)
+        else:
+            Notification.objects.bulk_create(notifications, batch_size=batch_size)
+            notified += len(notifications)
+    return notified
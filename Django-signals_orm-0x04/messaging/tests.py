@@ -1,3 +1,940 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .history import apply_delta, make_delta
+from .membership import CONVERSATION_IDS_KEY, get_conversation_ids, membership_version_key
+from .cache import (
+    DjangoSharedCache, NearCache, RedisSharedCache, bump_conversation_version, get_conversation_version,
+    get_shared_cache, get_version, message_page_key, set_shared_cache
+)
+from .models import Conversation, ConversationParticipant, Message, MessageHistory, Notification, User
+from .pagination import MessageCursorPagination
+from .permissions import IsParticipant
+from .serializers import MessageHistorySerializer
+from .signals import extract_mentions, handle_message_mentions, log_message_edit
+from .tasks import fan_out_message_notifications
+from .utils.thread_local import set_current_user
+from .utils.threads import build_message_tree, subtree_queryset
+from .views import ConversationViewSet
+
+
+class ConversationCountersTests(TestCase):
+    """
+    The denormalized conversation counters follow message changes
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            username='alice', email='alice@example.com', password='secret'
+        )
+        self.bob = User.objects.create_user(
+            username='bob', email='bob@example.com', password='secret'
+        )
+        self.conversation = Conversation.objects.create(created_by=self.alice)
+        self.alice_participant = ConversationParticipant.objects.create(
+            conversation=self.conversation, user=self.alice
+        )
+        self.bob_participant = ConversationParticipant.objects.create(
+            conversation=self.conversation, user=self.bob
+        )
+
+    def send(self, sender, body):
+        return Message.objects.create(
+            conversation=self.conversation, sender=sender, message_body=body
+        )
+
+    def refresh(self):
+        self.conversation.refresh_from_db()
+        self.alice_participant.refresh_from_db()
+        self.bob_participant.refresh_from_db()
+
+    def test_new_messages_update_counters(self):
+        self.send(self.alice, 'hello')
+        last = self.send(self.alice, 'x' * 150)
+        self.refresh()
+
+        self.assertEqual(self.conversation.message_count, 2)
+        self.assertEqual(self.conversation.last_message, last)
+        self.assertEqual(self.conversation.last_message_preview, 'x' * 100 + '...')
+        self.assertEqual(self.bob_participant.unread_count, 2)
+        self.assertEqual(self.alice_participant.unread_count, 0)
+
+    def test_mark_as_read_resets_unread_count(self):
+        self.send(self.alice, 'hello')
+        self.bob_participant.refresh_from_db()
+        self.bob_participant.mark_as_read()
+        self.refresh()
+
+        self.assertEqual(self.bob_participant.unread_count, 0)
+        self.send(self.alice, 'again')
+        self.bob_participant.refresh_from_db()
+        self.assertEqual(self.bob_participant.unread_count, 1)
+
+    def test_deletes_recount(self):
+        first = self.send(self.alice, 'first')
+        second = self.send(self.alice, 'second')
+
+        second.soft_delete()
+        self.refresh()
+        self.assertEqual(self.conversation.message_count, 1)
+        self.assertEqual(self.conversation.last_message, first)
+        self.assertEqual(self.bob_participant.unread_count, 1)
+
+        first.delete()
+        self.refresh()
+        self.assertEqual(self.conversation.message_count, 0)
+        self.assertIsNone(self.conversation.last_message)
+        self.assertEqual(self.conversation.last_message_preview, '')
+        self.assertEqual(self.bob_participant.unread_count, 0)
+
+    def test_bulk_delete_recounts_each_conversation_once(self):
+        other_conversation = Conversation.objects.create(created_by=self.alice)
+        kept = self.send(self.alice, 'kept')
+        for body in ('one', 'two', 'three'):
+            self.send(self.bob, body)
+            Message.objects.create(conversation=other_conversation, sender=self.bob, message_body=body)
+
+        refresh_counters = Conversation.refresh_counters
+        with mock.patch.object(
+            Conversation, 'refresh_counters', autospec=True, side_effect=refresh_counters
+        ) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.bob.delete()
+        self.assertEqual(
+            sorted(call.args[0].pk for call in refresh.call_args_list),
+            sorted([self.conversation.pk, other_conversation.pk])
+        )
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.message_count, 1)
+        self.assertEqual(self.conversation.last_message, kept)
+
+
+class ConversationListQueriesTests(TestCase):
+    """
+    The conversation list runs a fixed number of queries per page
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='owner', email='owner@example.com', password='secret'
+        )
+        self.view = ConversationViewSet.as_view({'get': 'list'})
+        self.factory = APIRequestFactory()
+
+    def add_conversations(self, count):
+        start = User.objects.count()
+        for index in range(start, start + count):
+            other = User.objects.create_user(
+                username=f'friend{index}', email=f'friend{index}@example.com',
+                password='secret', first_name='Friend', last_name=str(index)
+            )
+            conversation = Conversation.objects.create(created_by=self.user)
+            ConversationParticipant.objects.create(conversation=conversation, user=self.user)
+            ConversationParticipant.objects.create(conversation=conversation, user=other)
+            Message.objects.create(conversation=conversation, sender=other, message_body='hi')
+
+    def list_conversations(self):
+        request = self.factory.get('/conversations/')
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.view(request)
+            response.render()
+        return response, len(queries)
+
+    def test_query_count_is_constant(self):
+        self.add_conversations(2)
+        response, small_page_queries = self.list_conversations()
+        self.assertEqual(response.status_code, 200)
+
+        self.add_conversations(8)
+        response, large_page_queries = self.list_conversations()
+        self.assertEqual(response.data['count'], 10)
+        self.assertEqual(large_page_queries, small_page_queries)
+        self.assertLessEqual(large_page_queries, 4)
+
+        first = response.data['results'][0]
+        self.assertEqual(first['unread_count'], 1)
+        self.assertEqual(first['participant_count'], 2)
+        self.assertEqual(first['display_name'], 'Friend 10')
+        self.assertEqual(first['last_message']['message_body'], 'hi')
+
+
+class MessageCursorPaginationTests(TestCase):
+    """
+    Keyset pagination walks both ways without gaps or duplicates
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='secret'
+        )
+        self.conversation = Conversation.objects.create(created_by=self.user)
+        self.messages = [
+            Message.objects.create(
+                conversation=self.conversation, sender=self.user, message_body=str(index)
+            )
+            for index in range(7)
+        ]
+        # Identical timestamps must still page in a stable order
+        Message.objects.filter(pk__in=[m.pk for m in self.messages[2:5]]).update(
+            sent_at=self.messages[2].sent_at
+        )
+        self.queryset = Message.objects.filter(conversation=self.conversation)
+        self.factory = APIRequestFactory()
+
+    def paginate(self, url):
+        paginator = MessageCursorPagination()
+        page = paginator.paginate_queryset(self.queryset, Request(self.factory.get(url)))
+        return page, paginator
+
+    def test_walk_back_then_forward(self):
+        expected = list(self.queryset.order_by('-sent_at', '-message_id'))
+
+        seen = []
+        url = '/messages/?limit=3'
+        while url:
+            page, paginator = self.paginate(url)
+            seen.extend(page)
+            url = paginator.get_next_link()
+        self.assertEqual(seen, expected)
+
+        # From the oldest message, walk forward to the newest
+        newer = []
+        url = paginator.get_previous_link()
+        while url:
+            page, paginator = self.paginate(url)
+            newer = page + newer
+            url = paginator.get_previous_link()
+        self.assertEqual(newer, expected[:-1])
+
+    def test_first_page_has_no_newer_link(self):
+        page, paginator = self.paginate('/messages/?limit=10')
+        self.assertEqual(len(page), 7)
+        self.assertIsNone(paginator.get_next_link())
+        self.assertIsNone(paginator.get_previous_link())
+
+    def test_after_cursor_checks_for_older_messages(self):
+        oldest = self.queryset.order_by('sent_at', 'message_id').first()
+        page, paginator = self.paginate('/messages/?limit=3')
+        url = paginator.get_link(paginator.after_query_param, oldest)
+
+        page, paginator = self.paginate(url)
+        self.assertIsNotNone(paginator.get_next_link())
+
+        oldest.delete()
+        page, paginator = self.paginate(url)
+        self.assertEqual(len(page), 3)
+        self.assertIsNone(paginator.get_next_link())
+
+    def test_before_cursor_checks_for_newer_messages(self):
+        newest = self.queryset.order_by('-sent_at', '-message_id').first()
+        page, paginator = self.paginate('/messages/?limit=3')
+        url = paginator.get_link(paginator.before_query_param, newest)
+
+        page, paginator = self.paginate(url)
+        self.assertIsNotNone(paginator.get_previous_link())
+
+        newest.delete()
+        page, paginator = self.paginate(url)
+        self.assertEqual(len(page), 3)
+        self.assertIsNone(paginator.get_previous_link())
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(NotFound):
+            self.paginate('/messages/?before=not-a-cursor')
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the subset of the redis-py client that
+    RedisSharedCache uses, for tests without a Redis server
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return None if entry is None else entry[0]
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return None
+            if isinstance(value, str):
+                value = value.encode()
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+            return True
+
+    def eval(self, script, numkeys, key, delta):
+        """Runs RedisSharedCache.INCR_EXISTING_SCRIPT, the only script used"""
+        assert script == RedisSharedCache.INCR_EXISTING_SCRIPT
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            value = int(entry[0]) + delta
+            self._data[key] = (str(value).encode(), entry[1])
+            return value
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+
+class MessagePageCacheTests(TestCase):
+    """
+    Message pages are cached per user and dropped when messages change
+    """
+
+    def setUp(self):
+        self.shared = NearCache(RedisSharedCache(FakeRedis()))
+        set_shared_cache(self.shared)
+        self.addCleanup(set_shared_cache, None)
+        self.alice = User.objects.create_user(
+            username='alice', email='alice@example.com', password='secret'
+        )
+        self.bob = User.objects.create_user(
+            username='bob', email='bob@example.com', password='secret'
+        )
+        self.conversation = Conversation.objects.create(created_by=self.alice)
+        for user in (self.alice, self.bob):
+            ConversationParticipant.objects.create(conversation=self.conversation, user=user)
+        self.view = ConversationViewSet.as_view({'get': 'messages'})
+        self.factory = APIRequestFactory()
+
+    def send(self, sender, body):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Message.objects.create(
+                conversation=self.conversation, sender=sender, message_body=body
+            )
+
+    def get_messages(self, user):
+        request = self.factory.get(f'/conversations/{self.conversation.pk}/messages/')
+        force_authenticate(request, user=user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.view(request, pk=self.conversation.pk)
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_hits_skip_serialization_but_still_mark_read(self):
+        self.send(self.alice, 'hello')
+        _, miss_queries = self.get_messages(self.bob)
+
+        self.send(self.alice, 'again')
+        data, _ = self.get_messages(self.bob)
+        self.assertEqual([m['message_body'] for m in data['results']], ['again', 'hello'])
+
+        data, hit_queries = self.get_messages(self.bob)
+        self.assertLess(hit_queries, miss_queries)
+        self.assertEqual(len(data['results']), 2)
+        participant = ConversationParticipant.objects.get(conversation=self.conversation, user=self.bob)
+        self.assertEqual(participant.unread_count, 0)
+
+    def test_pages_are_per_user(self):
+        self.send(self.alice, 'hello')
+        self.get_messages(self.bob)
+        alice_key = message_page_key(self.alice.pk, self.conversation.pk, {})
+        self.assertIsNone(self.shared.get(alice_key))
+        self.get_messages(self.alice)
+        self.assertIsNotNone(self.shared.get(alice_key))
+
+
+class SharedCacheTests(TestCase):
+    """
+    Redis-backed store and the near cache in front of it
+    """
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.shared = RedisSharedCache(self.redis, prefix='test:')
+
+    def test_redis_round_trip(self):
+        self.shared.set('page', {'results': [1, 2]})
+        self.assertEqual(self.shared.get('page'), {'results': [1, 2]})
+        self.assertTrue(self.shared.add('version', 7))
+        self.assertFalse(self.shared.add('version', 1))
+        self.assertEqual(self.shared.incr('version'), 8)
+        self.assertEqual(self.shared.get('version'), 8)
+        with self.assertRaises(ValueError):
+            self.shared.incr('missing')
+        self.shared.delete('page')
+        self.assertIsNone(self.shared.get('page'))
+
+    def test_near_cache_serves_locally_until_ttl(self):
+        near = NearCache(self.shared, ttl=60)
+        other_process = NearCache(self.shared, ttl=60)
+        near.set('version', 1)
+        self.assertEqual(near.get('version'), 1)
+
+        other_process.incr('version')
+        self.assertEqual(near.get('version'), 1)
+        self.assertEqual(near.hits, 1)
+
+        with mock.patch('messaging.cache.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(near.get('version'), 2)
+
+        near.incr('version')
+        self.assertEqual(near.get('version'), 3)
+
+    def test_versions_bypass_near_cache(self):
+        near = NearCache(self.shared, ttl=60)
+        other_process = NearCache(self.shared, ttl=60)
+        set_shared_cache(near)
+        self.addCleanup(set_shared_cache, None)
+
+        version = get_conversation_version('conversation')
+        set_shared_cache(other_process)
+        bump_conversation_version('conversation')
+        set_shared_cache(near)
+        self.assertEqual(get_conversation_version('conversation'), version + 1)
+        self.assertEqual(near.hits, 0)
+
+    def test_near_cache_evicts_least_recently_used(self):
+        near = NearCache(self.shared, max_entries=2)
+        for key in ('a', 'b', 'c'):
+            self.shared.set(key, key)
+            near.get(key)
+        self.assertEqual(list(near._entries), ['b', 'c'])
+
+
+class NotificationFanOutTests(TestCase):
+    """
+    New message notifications are fanned out after commit, in batches
+    """
+
+    def setUp(self):
+        self.sender = User.objects.create_user(
+            username='sender', email='sender@example.com', password='secret'
+        )
+        self.conversation = Conversation.objects.create(
+            created_by=self.sender, conversation_type='group', title='Team'
+        )
+        ConversationParticipant.objects.create(conversation=self.conversation, user=self.sender)
+        self.members = []
+        for index in range(5):
+            member = User.objects.create_user(
+                username=f'member{index}', email=f'member{index}@example.com', password='secret'
+            )
+            ConversationParticipant.objects.create(
+                conversation=self.conversation, user=member, is_muted=index == 0
+            )
+            self.members.append(member)
+
+    def send(self, body):
+        return Message.objects.create(
+            conversation=self.conversation, sender=self.sender, message_body=body
+        )
+
+    def test_fan_out_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.send('hello')
+        self.assertEqual(Notification.objects.count(), 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Notification.objects.count(), 4)
+
+    @override_settings(NOTIFICATION_BATCH_SIZE=2)
+    def test_fan_out_skips_sender_and_muted_in_batches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            message = self.send('hello')
+
+        notifications = Notification.objects.filter(related_message=message)
+        self.assertEqual(
+            set(notifications.values_list('recipient__username', flat=True)),
+            {'member1', 'member2', 'member3', 'member4'}
+        )
+        self.assertEqual(notifications.first().title, 'New message in Team')
+        self.assertEqual(notifications.first().message, 'hello')
+
+    def test_coalesces_unread_notifications(self):
+        for body in ('one', 'two', 'three'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.send(body)
+
+        notifications = Notification.objects.filter(recipient=self.members[1])
+        self.assertEqual(notifications.count(), 1)
+        notification = notifications.get()
+        self.assertEqual(notification.count, 3)
+        self.assertEqual(notification.message, 'three')
+
+        notification.mark_as_read()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.send('four')
+        self.assertEqual(notifications.count(), 2)
+        self.assertEqual(notifications.get(is_read=False).count, 1)
+
+    def test_fan_outs_without_commit_in_between_both_count(self):
+        # Both messages are sent before either task runs, as with two
+        # workers picking them up at once
+        with self.captureOnCommitCallbacks():
+            first = self.send('one')
+            second = self.send('two')
+        self.assertFalse(Notification.objects.exists())
+
+        self.assertEqual(fan_out_message_notifications(first.pk), 4)
+        self.assertEqual(fan_out_message_notifications(second.pk), 4)
+
+        notifications = Notification.objects.filter(related_conversation=self.conversation)
+        self.assertEqual(notifications.count(), 4)
+        notification = notifications.get(recipient=self.members[1])
+        self.assertEqual(notification.count, 2)
+        self.assertEqual(notification.message, 'two')
+        self.assertEqual(notification.related_message, second)
+
+    @override_settings(NOTIFICATION_COALESCING=False)
+    def test_one_notification_per_message_without_coalescing(self):
+        for body in ('one', 'two'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.send(body)
+        self.assertEqual(Notification.objects.filter(recipient=self.members[1]).count(), 2)
+
+
+class MentionNotificationTests(TestCase):
+    """
+    Mentions are resolved in one query however many there are
+    """
+
+    def setUp(self):
+        self.sender = User.objects.create_user(
+            username='sender', email='sender@example.com', password='secret'
+        )
+        self.conversation = Conversation.objects.create(
+            created_by=self.sender, conversation_type='group', title='Team'
+        )
+        ConversationParticipant.objects.create(conversation=self.conversation, user=self.sender)
+        for index in range(6):
+            member = User.objects.create_user(
+                username=f'member{index}', email=f'member{index}@example.com', password='secret'
+            )
+            ConversationParticipant.objects.create(
+                conversation=self.conversation, user=member, is_active=index != 5
+            )
+        User.objects.create_user(username='outsider', email='outsider@example.com', password='secret')
+
+    def test_extract_mentions(self):
+        self.assertEqual(
+            extract_mentions('@ann, @bob.smith! hi @ann and mail me at x@example.com @. @'),
+            ['ann', 'bob.smith']
+        )
+
+    def test_mentions_resolved_in_one_query(self):
+        body = ' '.join(f'@member{index}' for index in range(6)) + ' @member0 @outsider @sender @nobody'
+        message = Message.objects.create(
+            conversation=self.conversation, sender=self.sender, message_body=body
+        )
+        mentions = Notification.objects.filter(notification_type='mention')
+        self.assertEqual(
+            sorted(mentions.values_list('recipient__username', flat=True)),
+            [f'member{index}' for index in range(5)]
+        )
+
+        mentions.delete()
+        with CaptureQueriesContext(connection) as queries:
+            handle_message_mentions(Message, message, created=True)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(mentions.count(), 5)
+
+
+class MessageEditHistoryTests(TestCase):
+    """
+    Edits are logged from the loaded snapshot, without re-reading the row
+    """
+
+    def setUp(self):
+        self.sender = User.objects.create_user(
+            username='sender', email='sender@example.com', password='secret'
+        )
+        self.conversation = Conversation.objects.create(created_by=self.sender)
+        created = Message.objects.create(
+            conversation=self.conversation, sender=self.sender, message_body='first'
+        )
+        self.message = Message.objects.get(pk=created.pk)
+        set_current_user(self.sender)
+        self.addCleanup(set_current_user, None)
+
+    def test_edit_is_logged_without_refetch(self):
+        self.message.message_body = 'second'
+        # Within a savepoint (2 queries here): lock the message row, read
+        # the newest history entry, insert the new one
+        with self.assertNumQueries(5):
+            log_message_edit(Message, self.message)
+
+        history = MessageHistory.objects.get(message=self.message)
+        self.assertEqual(history.previous_body, 'first')
+        self.assertEqual(history.edited_by, self.sender)
+        self.assertTrue(self.message.is_edited)
+        self.assertEqual(self.message.edited_by, self.sender)
+
+    def test_consecutive_edits_keep_each_previous_body(self):
+        for body in ('second', 'third'):
+            self.message.message_body = body
+            self.message.save()
+        self.assertEqual(
+            list(MessageHistory.objects.filter(message=self.message).values_list('previous_body', flat=True)
+                 .order_by('edited_at')),
+            ['first', 'second']
+        )
+
+    def test_edit_fields_saved_with_update_fields(self):
+        self.message.message_body = 'second'
+        self.message.save(update_fields=['message_body'])
+
+        saved = Message.objects.get(pk=self.message.pk)
+        self.assertEqual(saved.message_body, 'second')
+        self.assertTrue(saved.is_edited)
+        self.assertIsNotNone(saved.edited_at)
+        self.assertEqual(saved.edited_by, self.sender)
+
+    def test_failed_save_keeps_previous_body(self):
+        self.message.message_body = 'second'
+        with mock.patch.object(Message, '_do_update', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                self.message.save()
+        self.assertFalse(MessageHistory.objects.exists())
+
+        self.message.save()
+        history = MessageHistory.objects.get(message=self.message)
+        self.assertEqual(history.previous_body, 'first')
+
+    def test_flag_updates_do_no_work(self):
+        with self.assertNumQueries(0):
+            log_message_edit(Message, self.message, update_fields=frozenset({'is_deleted', 'deleted_at'}))
+        self.message.soft_delete()
+        self.assertFalse(MessageHistory.objects.exists())
+
+    def test_unchanged_body_is_not_logged(self):
+        with self.assertNumQueries(0):
+            log_message_edit(Message, self.message)
+        self.assertFalse(MessageHistory.objects.exists())
+
+
+class MessageThreadTests(TestCase):
+    """
+    Whole threads load in one query, whatever their size
+    """
+
+    def setUp(self):
+        self.sender = User.objects.create_user(
+            username='sender', email='sender@example.com', password='secret'
+        )
+        self.conversation = Conversation.objects.create(created_by=self.sender)
+        self.root = self.reply(None, 'root')
+        self.replies = [self.reply(self.root, f'reply {index}') for index in range(3)]
+        self.nested = [self.reply(reply, f'{reply.message_body}.{index}')
+                       for reply in self.replies for index in range(2)]
+        self.deepest = self.reply(self.nested[0], 'deepest')
+
+    def reply(self, parent, body):
+        return Message.objects.create(
+            conversation=self.conversation, sender=self.sender, message_body=body, parent_message=parent
+        )
+
+    def bodies(self, nodes):
+        return [node['message'].message_body for node in nodes]
+
+    def test_whole_thread_in_one_query(self):
+        with self.assertNumQueries(1):
+            tree = build_message_tree(self.root)
+            self.assertEqual(tree['replies'][0]['message'].sender.username, 'sender')
+
+        self.assertEqual(self.bodies(tree['replies']), ['reply 0', 'reply 1', 'reply 2'])
+        self.assertEqual(tree['reply_count'], 3)
+        first = tree['replies'][0]
+        self.assertEqual(self.bodies(first['replies']), ['reply 0.0', 'reply 0.1'])
+        self.assertEqual(self.bodies(first['replies'][0]['replies']), ['deepest'])
+        self.assertEqual(first['replies'][0]['replies'][0]['replies'], [])
+
+    def test_old_import_path_still_builds_trees(self):
+        from .utils.thread_local import build_message_tree as old_build_message_tree
+        self.assertEqual(
+            self.bodies(old_build_message_tree(self.root, replies_limit=2)['replies']),
+            ['reply 0', 'reply 1']
+        )
+
+    def test_thread_fields_set_on_insert(self):
+        self.assertEqual(self.root.thread_root_id, self.root.pk)
+        self.assertEqual(self.root.depth, 0)
+        self.assertEqual(self.deepest.thread_root_id, self.root.pk)
+        self.assertEqual(self.deepest.depth, 3)
+        self.assertTrue(self.deepest.path.startswith(self.nested[0].path + '.'))
+        self.assertEqual(
+            list(self.replies[0].get_descendants()),
+            [self.nested[0], self.deepest, self.nested[1]]
+        )
+        self.assertEqual(self.root.get_thread().count(), 11)
+
+    def test_unplaced_thread_stays_in_its_conversation(self):
+        other = Conversation.objects.create(created_by=self.sender)
+        Message.objects.create(conversation=other, sender=self.sender, message_body='elsewhere')
+        Message.objects.update(thread_root=None, path='', depth=0)
+
+        reply = Message.objects.get(pk=self.replies[0].pk)
+        self.assertEqual(
+            [message.message_body for message in reply.get_thread()],
+            ['reply 0', 'reply 0.0', 'reply 0.1', 'deepest']
+        )
+        self.assertEqual(list(reply.get_descendants()), [self.nested[0], self.nested[1], self.deepest])
+
+    def test_thread_survives_hard_deleted_root(self):
+        root_id = self.root.pk
+        self.root.delete()
+        reply = Message.objects.get(pk=self.replies[0].pk)
+        self.assertEqual(reply.thread_root_id, root_id)
+        self.assertEqual(reply.get_thread().count(), 10)
+
+    def test_subtree_fetch_is_an_index_range(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan format is SQLite specific')
+        plan = subtree_queryset(self.replies[0]).explain()
+        self.assertIn('messages_thread_path_idx', plan)
+        self.assertIn('path>? AND path<?', plan)
+        self.assertEqual(
+            list(subtree_queryset(self.replies[0])),
+            [self.replies[0], self.nested[0], self.deepest, self.nested[1]]
+        )
+
+    def test_too_deep_reply_is_rejected(self):
+        ConversationParticipant.objects.create(conversation=self.conversation, user=self.sender)
+        Message.objects.filter(pk=self.deepest.pk).update(depth=Message.MAX_THREAD_DEPTH)
+        view = ConversationViewSet.as_view({'post': 'send_message'})
+        request = APIRequestFactory().post(
+            f'/conversations/{self.conversation.pk}/send_message/',
+            {'message_body': 'too deep', 'parent_message': str(self.deepest.pk)},
+            format='json'
+        )
+        force_authenticate(request, user=self.sender)
+        response = view(request, pk=self.conversation.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nested', str(response.data))
+
+    def test_backfill_matches_insert_order(self):
+        Message.objects.update(thread_root=None, path='', depth=0)
+        root = Message.objects.get(pk=self.root.pk)
+        self.assertEqual(self.bodies(build_message_tree(root)['replies']), ['reply 0', 'reply 1', 'reply 2'])
+
+        out = StringIO()
+        call_command('backfill_message_threads', batch_size=3, stdout=out)
+        self.assertIn('Backfilled 11 messages', out.getvalue())
+
+        root = Message.objects.get(pk=self.root.pk)
+        self.assertEqual(
+            [message.message_body for message in root.get_thread()],
+            ['root', 'reply 0', 'reply 0.0', 'deepest', 'reply 0.1',
+             'reply 1', 'reply 1.0', 'reply 1.1', 'reply 2', 'reply 2.0', 'reply 2.1']
+        )
+        deepest = Message.objects.get(pk=self.deepest.pk)
+        self.assertEqual((deepest.thread_root_id, deepest.depth), (root.pk, 3))
+
+    def test_depth_limit_keeps_counts(self):
+        tree = build_message_tree(self.root, max_depth=1)
+        first = tree['replies'][0]
+        self.assertEqual(first['replies'], [])
+        self.assertEqual(first['reply_count'], 2)
+        self.assertTrue(first['has_more_replies'])
+
+    def test_replies_are_paginated(self):
+        tree = build_message_tree(self.root, replies_limit=2)
+        self.assertEqual(self.bodies(tree['replies']), ['reply 0', 'reply 1'])
+        self.assertTrue(tree['has_more_replies'])
+
+        tree = build_message_tree(self.root, replies_limit=2, replies_offset=2)
+        self.assertEqual(self.bodies(tree['replies']), ['reply 2'])
+        self.assertFalse(tree['has_more_replies'])
+        self.assertEqual(self.bodies(tree['replies'][0]['replies']), ['reply 2.0', 'reply 2.1'])
+
+
+class MessageHistoryStorageTests(TestCase):
+    """
+    Edit history keeps periodic snapshots and deltas, read back as full text
+    """
+
+    def setUp(self):
+        self.sender = User.objects.create_user(
+            username='sender', email='sender@example.com', password='secret'
+        )
+        self.conversation = Conversation.objects.create(created_by=self.sender)
+        self.paragraph = ' '.join(f'word{index}' for index in range(200))
+        self.bodies = [f'{self.paragraph} edit {index}' for index in range(13)]
+
+    def edit_message(self):
+        message = Message.objects.create(
+            conversation=self.conversation, sender=self.sender, message_body=self.bodies[0]
+        )
+        for body in self.bodies[1:]:
+            message.message_body = body
+            message.save()
+        return message
+
+    def serialized_history(self, message):
+        return [entry['previous_body'] for entry in MessageHistorySerializer(message.history.all(), many=True).data]
+
+    def test_delta_round_trip(self):
+        base = 'The quick  brown fox\njumps over the lazy dog'
+        text = 'The slow brown fox\njumps over the dog!'
+        self.assertEqual(apply_delta(base, make_delta(base, text)), text)
+        self.assertEqual(apply_delta('', make_delta('', text)), text)
+        self.assertEqual(apply_delta(base, make_delta(base, '')), '')
+
+    @override_settings(MESSAGE_HISTORY_SNAPSHOT_INTERVAL=5)
+    def test_snapshots_and_deltas(self):
+        message = self.edit_message()
+        entries = {entry.version: entry for entry in MessageHistory.objects.filter(message=message)}
+        self.assertEqual(sorted(entries), list(range(1, 13)))
+        self.assertEqual(
+            sorted(version for version, entry in entries.items() if entry.delta is None),
+            [5, 10, 12]
+        )
+        self.assertEqual(entries[3].previous_body, '')
+
+        expected = list(reversed(self.bodies[:-1]))
+        self.assertEqual(self.serialized_history(message), expected)
+        self.assertEqual(
+            [MessageHistorySerializer(entry).data['previous_body'] for entry in message.history.all()],
+            expected
+        )
+
+    def test_output_matches_full_storage(self):
+        with override_settings(MESSAGE_HISTORY_STORAGE='full'):
+            full = self.edit_message()
+        compact = self.edit_message()
+        self.assertEqual(self.serialized_history(compact), self.serialized_history(full))
+
+        def stored(message):
+            return sum(
+                len(entry.previous_body) + len(json.dumps(entry.delta or ''))
+                for entry in MessageHistory.objects.filter(message=message)
+            )
+        self.assertLess(stored(compact) * 4, stored(full))
+
+    @override_settings(MESSAGE_HISTORY_SNAPSHOT_INTERVAL=5)
+    def test_deleting_an_entry_keeps_older_versions(self):
+        message = self.edit_message()
+        MessageHistory.objects.filter(message=message, version__in=[3, 8]).delete()
+        MessageHistory.objects.get(message=message, version=9).delete()
+        self.assertIsNone(MessageHistory.objects.get(message=message, version=7).delta)
+
+        expected = [body for version, body in enumerate(self.bodies[:-1], 1) if version not in (3, 8, 9)]
+        self.assertEqual(self.serialized_history(message), list(reversed(expected)))
+
+    def test_broken_chain_reads_as_empty(self):
+        message = self.edit_message()
+        MessageHistory.objects.filter(message=message, version=4)._raw_delete(connection.alias)
+        with self.assertLogs('messaging.history', 'WARNING'):
+            bodies = self.serialized_history(message)
+        self.assertEqual(bodies[-3:], ['', '', ''])
+        self.assertEqual(bodies[0], self.bodies[-2])
+
+    def test_list_with_missing_newer_entries(self):
+        message = self.edit_message()
+        oldest = list(message.history.order_by('version')[:3])
+        data = MessageHistorySerializer(oldest, many=True).data
+        self.assertEqual([entry['previous_body'] for entry in data], self.bodies[:3])
+
+
+@override_settings(MESSAGING_MEMBERSHIP_CACHE_TTL=30)
+class MembershipResolverTests(TestCase):
+    """
+    Memberships are resolved once per request and shared between requests
+    """
+
+    def setUp(self):
+        # A long near cache TTL: memberships must not be kept in it
+        set_shared_cache(NearCache(RedisSharedCache(FakeRedis()), ttl=60))
+        self.addCleanup(set_shared_cache, None)
+        self.user = User.objects.create_user(
+            username='member', email='member@example.com', password='secret'
+        )
+        self.conversation = Conversation.objects.create(created_by=self.user)
+        self.other_conversation = Conversation.objects.create(created_by=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.participant = ConversationParticipant.objects.create(
+                conversation=self.conversation, user=self.user
+            )
+        self.message = Message.objects.create(
+            conversation=self.conversation, sender=self.user, message_body='hi'
+        )
+        self.factory = APIRequestFactory()
+
+    def make_request(self):
+        request = Request(self.factory.get('/'))
+        request.user = self.user
+        return request
+
+    def test_permission_checks_share_one_query(self):
+        permission = IsParticipant()
+        request = self.make_request()
+        with self.assertNumQueries(1):
+            self.assertTrue(permission.has_object_permission(request, None, self.conversation))
+            self.assertTrue(permission.has_object_permission(request, None, self.message))
+            self.assertFalse(permission.has_object_permission(request, None, self.other_conversation))
+
+        with self.assertNumQueries(0):
+            self.assertTrue(permission.has_object_permission(self.make_request(), None, self.message))
+
+    @override_settings(MESSAGING_MEMBERSHIP_CACHE_TTL=0)
+    def test_without_shared_cache(self):
+        with self.assertNumQueries(1):
+            get_conversation_ids(self.make_request())
+        with self.assertNumQueries(1):
+            get_conversation_ids(self.make_request())
+
+    def test_not_shared_through_a_per_process_cache(self):
+        set_shared_cache(DjangoSharedCache('default'))
+        with self.assertNumQueries(1):
+            get_conversation_ids(self.make_request())
+        with self.assertNumQueries(1):
+            get_conversation_ids(self.make_request())
+
+    def test_stale_write_after_leave_is_not_read(self):
+        # A request that read the database before the leave committed...
+        stale_key = CONVERSATION_IDS_KEY.format(
+            user_id=self.user.pk, version=get_version(membership_version_key(self.user.pk))
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.participant.is_active = False
+            self.participant.save()
+        # ...and writes its result after the invalidation
+        get_shared_cache().origin.set(stale_key, frozenset({self.conversation.pk}), 30)
+        self.assertEqual(get_conversation_ids(self.make_request()), frozenset())
+
+    def test_join_and_leave_invalidate(self):
+        get_conversation_ids(self.make_request())
+        with self.captureOnCommitCallbacks(execute=True):
+            ConversationParticipant.objects.create(conversation=self.other_conversation, user=self.user)
+        self.assertEqual(
+            get_conversation_ids(self.make_request()),
+            {self.conversation.pk, self.other_conversation.pk}
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.participant.is_active = False
+            self.participant.save()
+        self.assertEqual(get_conversation_ids(self.make_request()), {self.other_conversation.pk})
+
+    def test_read_state_updates_keep_cache(self):
+        get_conversation_ids(self.make_request())
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.participant.mark_as_read()
+        self.assertEqual(callbacks, [])
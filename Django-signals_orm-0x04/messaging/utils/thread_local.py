@@ -8,11 +8,8 @@ def set_current_user(user):
 def get_current_user():
     return getattr(_user, 'value', None)
 
-def build_message_tree(message):
-    """Recursively build the thread of replies for a message"""
-    return {
-        'message': message,
-        'replies': [
-            build_message_tree(reply) for reply in message.replies.all().select_related('sender')
-        ]
-    }
\ No newline at end of file
+def build_message_tree(message, **kwargs):
+    """Moved to messaging.utils.threads; kept here for existing imports"""
+    # Imported here so this module stays free of model imports
+    from .threads import build_message_tree
+    return build_message_tree(message, **kwargs)
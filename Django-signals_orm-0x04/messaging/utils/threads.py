@@ -0,0 +1,89 @@
+from collections import defaultdict
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from ..models import Message
+
+# Replies nested deeper than this are not loaded
+THREAD_MAX_DEPTH = Message.MAX_THREAD_DEPTH
+
+THREAD_SQL = """
+WITH RECURSIVE thread (message_id, depth) AS (
+    SELECT {pk} AS message_id, 0 AS depth FROM {table} WHERE {pk} = %s
+    UNION ALL
+    SELECT child.{pk}, thread.depth + 1
+    FROM {table} child JOIN thread ON child.{parent} = thread.message_id
+    WHERE thread.depth < %s
+)
+SELECT message_id FROM thread
+"""
+
+
+def thread_queryset(message, max_depth=THREAD_MAX_DEPTH):
+    """
+    The message and its replies down to `max_depth` levels, selected with
+    a single recursive CTE on parent_message
+    """
+    connection = connections[Message.objects.db]
+    quote = connection.ops.quote_name
+    pk = Message._meta.pk
+    sql = THREAD_SQL.format(
+        pk=quote(pk.column),
+        table=quote(Message._meta.db_table),
+        parent=quote(Message._meta.get_field('parent_message').column)
+    )
+    params = (pk.get_db_prep_value(message.pk, connection), max_depth)
+    return Message.objects.filter(pk__in=RawSQL(sql, params))
+
+
+def subtree_queryset(message, max_depth=THREAD_MAX_DEPTH):
+    """
+    The message and its replies down to `max_depth` levels, in thread
+    order. Uses a prefix range on the (thread_root, path) index, or the
+    recursive query for messages not backfilled yet.
+    """
+    if not message.path:
+        return thread_queryset(message, max_depth).order_by('sent_at', 'message_id')
+    start, end = message.get_subtree_path_range()
+    return Message.objects.filter(
+        thread_root_id=message.thread_root_id,
+        path__gte=start,
+        path__lt=end,
+        depth__lte=message.depth + max_depth
+    ).order_by('path')
+
+
+def build_message_tree(message, max_depth=THREAD_MAX_DEPTH, replies_limit=None, replies_offset=0):
+    """
+    Thread of replies below `message`, loaded in one query and assembled
+    in memory. The message needs its thread fields loaded.
+
+    Every node is {'message', 'replies', 'reply_count', 'has_more_replies'}
+    with replies oldest first. Only `replies_limit` replies are kept per
+    node (all when None), starting at `replies_offset` for the top node, so
+    the next page of a node's replies is
+    build_message_tree(node['message'], replies_offset=n).
+    Nodes at `max_depth` get no replies, but their reply_count is exact.
+    """
+    # One level more than returned, so the last level still has counts
+    replies_by_parent = defaultdict(list)
+    for reply in subtree_queryset(message, max_depth + 1).select_related('sender'):
+        if reply.pk != message.pk:
+            replies_by_parent[reply.parent_message_id].append(reply)
+
+    tree = {'message': message}
+    pending = [(tree, 0, replies_offset)]
+    while pending:
+        node, depth, offset = pending.pop()
+        replies = replies_by_parent.get(node['message'].pk, [])
+        if depth < max_depth:
+            end = len(replies) if replies_limit is None else offset + replies_limit
+            page = replies[offset:end]
+        else:
+            page = []
+        node['replies'] = [{'message': reply} for reply in page]
+        node['reply_count'] = len(replies)
+        node['has_more_replies'] = len(replies) > offset + len(page)
+        pending.extend((child, depth + 1, 0) for child in node['replies'])
+    return tree
@@ -4,10 +4,11 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Prefetch
-from django.views.decorators.cache import cache_page
-from django.utils.decorators import method_decorator
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery
 
+from messaging.cache import cached_message_page
+from messaging.membership import is_participant, member_conversations
+from messaging.pagination import MessageCursorPagination
 from messaging.permissions import IsParticipant
 from .models import Conversation, Message, ConversationParticipant, MessageReaction
 from .serializers import (
@@ -30,6 +31,19 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+
+def conversation_messages(conversation):
+    """
+    Visible messages of one conversation, ready for serializing; callers
+    order and slice them through MessageCursorPagination
+    """
+    return Message.objects.filter(
+        conversation=conversation,
+        is_deleted=False
+    ).select_related('sender', 'parent_message__sender').prefetch_related(
+        'message_reactions__user'
+    )
+
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
    
     @classmethod
@@ -119,17 +133,40 @@ class ConversationViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """
-        Filter conversations to show only those the user participates in
-        with optimized prefetching for performance
+        Filter conversations to show only those the user participates in.
+        List and detail views also get every serialized field annotated or
+        prefetched up front, so they run a fixed number of queries
+        whatever the page size.
         """
-        return Conversation.objects.filter(
-            conversation_participants__user=self.request.user,
-            conversation_participants__is_active=True,
+        user = self.request.user
+        memberships = ConversationParticipant.objects.filter(user=user, is_active=True)
+        queryset = Conversation.objects.filter(
+            pk__in=member_conversations(self.request),
             is_active=True
-        ).select_related('created_by').prefetch_related(
-            'conversation_participants__user',
-            'messages'
-        ).distinct().order_by('-updated_at')
+        ).order_by('-updated_at')
+
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+
+        return queryset.annotate(
+            user_unread_count=Subquery(
+                memberships.filter(conversation=OuterRef('pk')).values('unread_count')[:1]
+            ),
+            active_participant_count=Count(
+                'conversation_participants',
+                filter=Q(conversation_participants__is_active=True)
+            )
+        ).select_related('created_by', 'last_message__sender').prefetch_related(
+            Prefetch(
+                'conversation_participants',
+                queryset=ConversationParticipant.objects.select_related('user')
+            ),
+            Prefetch(
+                'conversation_participants',
+                queryset=ConversationParticipant.objects.exclude(user=user).select_related('user'),
+                to_attr='other_participants'
+            )
+        )
     
     def create(self, request, *args, **kwargs):
         """Create a new conversation with proper context"""
@@ -160,15 +197,13 @@ class ConversationViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED
         )
     
-    @method_decorator(cache_page(60))
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
         """
         Get paginated messages for a specific conversation
-        Cached for 60 seconds
+        Pages are cached per user until the conversation changes
         """
         conversation = self.get_object()
-        self.check_object_permissions(request, conversation)
 
         participant = ConversationParticipant.objects.filter(
             conversation=conversation,
@@ -178,23 +213,19 @@ class ConversationViewSet(viewsets.ModelViewSet):
         if participant:
             participant.mark_as_read()
         
+        def build_page():
+            paginator = MessageCursorPagination()
+            messages = paginator.paginate_queryset(
+                conversation_messages(conversation), request, view=self
+            )
+            serializer = MessageSerializer(
+                messages, 
+                many=True, 
+                context={'request': request}
+            )
+            return paginator.get_paginated_response(serializer.data).data
 
-        page = request.query_params.get('page', 1)
-        limit = min(int(request.query_params.get('limit', 50)), 100) 
-        offset = (int(page) - 1) * limit
-        
-        messages = conversation.messages.filter(
-            is_deleted=False
-        ).select_related('sender', 'reply_to__sender').prefetch_related(
-            'message_reactions__user'
-        ).order_by('-sent_at')[offset:offset + limit]
-        
-        serializer = MessageSerializer(
-            messages, 
-            many=True, 
-            context={'request': request}
-        )
-        return Response(serializer.data)
+        return Response(cached_message_page(request, conversation, build_page))
     
     @action(detail=True, methods=['post'])
     def send_message(self, request, pk=None):
@@ -202,7 +233,6 @@ class ConversationViewSet(viewsets.ModelViewSet):
         Send a message to a specific conversation
         """
         conversation = self.get_object()
-        self.check_object_permissions(request, conversation)
 
         # Check if user is an active participant
         # participant = ConversationParticipant.objects.filter(
@@ -297,8 +327,6 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def add_participant(self, request, pk=None):
         conversation = self.get_object()
 
-        self.check_object_permissions(request, conversation)
-
         participant = ConversationParticipant.objects.filter(
             conversation=conversation,
             user=request.user,
@@ -341,7 +369,6 @@ class ConversationViewSet(viewsets.ModelViewSet):
         Leave a conversation (mark participant as inactive)
         """
         conversation = self.get_object()
-        self.check_object_permissions(request, conversation)
 
         
         participant = ConversationParticipant.objects.filter(
@@ -377,12 +404,11 @@ class MessageViewSet(viewsets.ModelViewSet):
         Filter messages to show only those in conversations the user participates in
         """
         return Message.objects.filter(
-            conversation__conversation_participants__user=self.request.user,
-            conversation__conversation_participants__is_active=True,
+            conversation_id__in=member_conversations(self.request),
             is_deleted=False
-        ).select_related('sender', 'conversation', 'reply_to__sender').prefetch_related(
+        ).select_related('sender', 'conversation', 'parent_message__sender').prefetch_related(
             'message_reactions__user'
-        ).distinct().order_by('-sent_at')
+        ).order_by('-sent_at')
     
     def perform_create(self, serializer):
         """
@@ -390,13 +416,7 @@ class MessageViewSet(viewsets.ModelViewSet):
         """
         conversation = serializer.validated_data['conversation']
 
-        participant = ConversationParticipant.objects.filter(
-            conversation=conversation,
-            user=self.request.user,
-            is_active=True
-        ).first()
-        
-        if not participant:
+        if not is_participant(self.request, conversation.pk):
             from rest_framework import serializers as drf_serializers
             raise drf_serializers.ValidationError(
                 'You are not an active participant in this conversation'
@@ -416,7 +436,6 @@ class MessageViewSet(viewsets.ModelViewSet):
         """
         
         message = self.get_object()
-        self.check_object_permissions(request, message)
         
         serializer = MessageReactionCreateSerializer(
             data=request.data,
@@ -450,7 +469,6 @@ class MessageViewSet(viewsets.ModelViewSet):
         Edit a message (only by sender)
         """
         message = self.get_object()
-        self.check_object_permissions(request, message)
         
         if message.sender != request.user:
             return Response(
@@ -478,7 +496,6 @@ class MessageViewSet(viewsets.ModelViewSet):
         Soft delete a message (only by sender)
         """
         message = self.get_object()
-        self.check_object_permissions(request, message)
         
         if message.sender != request.user:
             return Response(
@@ -491,12 +508,11 @@ class MessageViewSet(viewsets.ModelViewSet):
         
         return Response({'message': 'Message deleted successfully'})
     
-    @method_decorator(cache_page(60))
     @action(detail=False, methods=['get'])
     def by_conversation(self, request):
         """
         Get messages filtered by conversation ID with pagination
-        Cached for 60 seconds
+        Pages are cached per user until the conversation changes
         """
         conversation_id = request.query_params.get('conversation_id')
         if not conversation_id:
@@ -507,10 +523,7 @@ class MessageViewSet(viewsets.ModelViewSet):
        
 
         conversation = get_object_or_404(
-            Conversation.objects.filter(
-                conversation_participants__user=request.user,
-                conversation_participants__is_active=True
-            ),
+            Conversation.objects.filter(pk__in=member_conversations(request)),
             conversation_id=conversation_id
         )
         
@@ -524,12 +537,12 @@ class MessageViewSet(viewsets.ModelViewSet):
         if participant:
             participant.mark_as_read()
         
-        queryset = self.get_queryset().filter(conversation=conversation).order_by('-sent_at')
-        page = self.paginate_queryset(queryset)
-
-        if page is not None:
+        def build_page():
+            paginator = MessageCursorPagination()
+            page = paginator.paginate_queryset(
+                conversation_messages(conversation), request, view=self
+            )
             serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-       
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+            return paginator.get_paginated_response(serializer.data).data
+
+        return Response(cached_message_page(request, conversation, build_page))
\ No newline at end of file
@@ -49,12 +49,30 @@ INSTALLED_APPS = [
 
 
 # Cache Configs
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# With REDIS_URL set, every worker shares one Redis cache (via django-redis)
+# and messaging.cache puts a small per-process near cache in front of it.
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
+    }
+
+MESSAGING_NEAR_CACHE_ENTRIES = config('MESSAGING_NEAR_CACHE_ENTRIES', default=1024, cast=int)
+MESSAGING_NEAR_CACHE_TTL = config('MESSAGING_NEAR_CACHE_TTL', default=2.0, cast=float)
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -192,4 +210,38 @@ SIMPLE_JWT = {
     'JTI_CLAIM': 'jti',
 }
 
-AUTH_USER_MODEL = 'messaging.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'messaging.User'
+
+# Celery
+# Without a broker configured, tasks run inline (eagerly) in the calling
+# process, which is what development and the test suite use.
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='memory://')
+CELERY_TASK_ALWAYS_EAGER = config(
+    'CELERY_TASK_ALWAYS_EAGER',
+    default=CELERY_BROKER_URL == 'memory://',
+    cast=bool
+)
+# Only surface eager task errors while debugging: in production they would
+# be raised from on_commit callbacks after the response was committed
+CELERY_TASK_EAGER_PROPAGATES = config('CELERY_TASK_EAGER_PROPAGATES', default=DEBUG, cast=bool)
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Notifications written per INSERT when fanning out a message
+NOTIFICATION_BATCH_SIZE = config('NOTIFICATION_BATCH_SIZE', default=500, cast=int)
+
+# Keep one unread new_message notification per recipient and conversation,
+# counting the messages folded into it, instead of one row per message
+NOTIFICATION_COALESCING = config('NOTIFICATION_COALESCING', default=True, cast=bool)
+
+# Message edit history: 'delta' keeps full text only every
+# MESSAGE_HISTORY_SNAPSHOT_INTERVAL versions and for the newest one, and
+# reverse deltas in between; 'full' keeps the whole text of every version
+MESSAGE_HISTORY_STORAGE = config('MESSAGE_HISTORY_STORAGE', default='delta')
+MESSAGE_HISTORY_SNAPSHOT_INTERVAL = config('MESSAGE_HISTORY_SNAPSHOT_INTERVAL', default=10, cast=int)
+
+# Seconds a user's conversation memberships stay in the shared cache
+# (only used with REDIS_URL); joins and leaves drop them once committed.
+# 0 loads them once per request.
+MESSAGING_MEMBERSHIP_CACHE_TTL = config('MESSAGING_MEMBERSHIP_CACHE_TTL', default=0, cast=int)
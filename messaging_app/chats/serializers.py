@@ -2,11 +2,15 @@
 
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db.models import Count
 from django.utils import timezone
 from .models import User, Conversation, ConversationParticipant, Message, MessageReaction
 
 User = get_user_model()
 
+# Reaction type -> emoji, built once instead of per reaction
+REACTION_EMOJI = dict(MessageReaction.REACTION_TYPES)
+
 
 class UserSerializer(serializers.ModelSerializer):
     """
@@ -61,7 +65,7 @@ class UserMinimalSerializer(serializers.ModelSerializer):
     """
     Minimal User serializer for nested relationships (reduces payload size)
     """
-    full_name = serializers.SerializerMethodField()
+    full_name = serializers.CharField(read_only=True)
     
     class Meta:
         model = User
@@ -75,7 +79,7 @@ class UserMinimalSerializer(serializers.ModelSerializer):
         data = super().to_representation(instance)
         
         # Populate full_name
-        full_name = instance.get_field_names()
+        full_name = instance.get_full_name()
         data['full_name'] = full_name if full_name.strip() else instance.username
         
         return data
@@ -100,11 +104,37 @@ class MessageReactionSerializer(serializers.ModelSerializer):
         data = super().to_representation(instance)
         
         # Populate reaction_emoji
-        data['reaction_emoji'] = dict(MessageReaction.REACTION_TYPES).get(instance.reaction_type, '')
+        data['reaction_emoji'] = REACTION_EMOJI.get(instance.reaction_type, '')
         
         return data
 
 
+class MessageListSerializer(serializers.ListSerializer):
+    """
+    Serializes a page of messages with one grouped reply count query for
+    the whole page, instead of one per message. Reaction summaries come
+    from the message_reactions the views prefetch.
+    """
+
+    def to_representation(self, data):
+        messages = list(data.all() if hasattr(data, 'all') else data)
+        message_ids = [message.pk for message in messages]
+
+        self.replies_counts = {}
+        if message_ids:
+            reply_rows = Message.objects.filter(
+                reply_to_id__in=message_ids,
+                is_deleted=False
+            ).order_by().values('reply_to_id').annotate(count=Count('message_id'))
+            for row in reply_rows:
+                self.replies_counts[row['reply_to_id']] = row['count']
+
+        try:
+            return [self.child.to_representation(message) for message in messages]
+        finally:
+            del self.replies_counts
+
+
 class MessageSerializer(serializers.ModelSerializer):
     """
     Main Message serializer with nested relationships
@@ -129,6 +159,7 @@ class MessageSerializer(serializers.ModelSerializer):
             'message_id', 'sent_at', 'updated_at', 'is_edited', 
             'edited_at', 'is_deleted'
         ]
+        list_serializer_class = MessageListSerializer
     
     def to_representation(self, instance):
         """
@@ -149,23 +180,29 @@ class MessageSerializer(serializers.ModelSerializer):
         else:
             data['reply_to_message'] = None
         
-        # Populate reaction_summary
-        reactions = instance.message_reactions.all()
+        # Populate reaction_summary from the (prefetched) reactions, so the
+        # counts and user lists always agree
         summary = {}
-        for reaction in reactions:
+        for reaction in instance.message_reactions.all():
             reaction_type = reaction.reaction_type
             if reaction_type not in summary:
                 summary[reaction_type] = {
                     'count': 0,
-                    'emoji': dict(MessageReaction.REACTION_TYPES).get(reaction_type, ''),
+                    'emoji': REACTION_EMOJI.get(reaction_type, ''),
                     'users': []
                 }
             summary[reaction_type]['count'] += 1
             summary[reaction_type]['users'].append(reaction.user.username)
         data['reaction_summary'] = summary
+
+        # Populate replies_count, from the counts MessageListSerializer
+        # fetched for the page when listing
+        batch = self.parent if isinstance(self.parent, MessageListSerializer) else None
         
-        # Populate replies_count
-        data['replies_count'] = instance.replies.filter(is_deleted=False).count()
+        if batch is not None:
+            data['replies_count'] = batch.replies_counts.get(instance.pk, 0)
+        else:
+            data['replies_count'] = instance.replies.filter(is_deleted=False).count()
         
         # Populate file_url
         if instance.file_attachment:
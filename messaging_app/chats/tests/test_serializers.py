@@ -0,0 +1,64 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from chats.models import Conversation, Message, MessageReaction, User
+from chats.serializers import MessageSerializer
+
+
+class MessageListSerializerTests(TestCase):
+    """
+    Reply counts and reaction summaries are batched per page
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            username='alice', email='alice@example.com', password='secret'
+        )
+        self.bob = User.objects.create_user(
+            username='bob', email='bob@example.com', password='secret'
+        )
+        self.conversation = Conversation.objects.create(created_by=self.alice)
+
+    def add_messages(self, count):
+        for index in range(count):
+            message = Message.objects.create(
+                conversation=self.conversation, sender=self.alice, message_body=f'message {index}'
+            )
+            Message.objects.create(
+                conversation=self.conversation, sender=self.bob, message_body='reply', reply_to=message
+            )
+            MessageReaction.objects.create(message=message, user=self.alice, reaction_type='like')
+            MessageReaction.objects.create(message=message, user=self.bob, reaction_type='like')
+            MessageReaction.objects.create(message=message, user=self.bob, reaction_type='love')
+
+    def serialize_page(self):
+        messages = Message.objects.filter(
+            conversation=self.conversation, reply_to__isnull=True
+        ).select_related('sender', 'reply_to__sender').prefetch_related('message_reactions__user')
+        with CaptureQueriesContext(connection) as queries:
+            data = MessageSerializer(messages, many=True).data
+        return data, len(queries)
+
+    def test_query_count_is_constant(self):
+        self.add_messages(2)
+        _, small_page_queries = self.serialize_page()
+
+        self.add_messages(6)
+        data, large_page_queries = self.serialize_page()
+        self.assertEqual(len(data), 8)
+        self.assertEqual(large_page_queries, small_page_queries)
+        # Messages, reactions and their users (prefetched), reply counts
+        self.assertEqual(large_page_queries, 4)
+
+    def test_summary_matches_single_message(self):
+        self.add_messages(1)
+        message = Message.objects.get(message_body='message 0')
+        batched, _ = self.serialize_page()
+        single = MessageSerializer(message).data
+
+        self.assertEqual(batched[0]['replies_count'], 1)
+        self.assertEqual(batched[0]['reaction_summary'], single['reaction_summary'])
+        self.assertEqual(batched[0]['reaction_summary']['like']['count'], 2)
+        self.assertEqual(sorted(batched[0]['reaction_summary']['like']['users']), ['alice', 'bob'])
+        self.assertEqual(batched[0]['reaction_summary']['love']['emoji'], '❤️')
@@ -1,7 +1,10 @@
 import asyncio
 import aiosqlite
+import contextlib
 import time
 
+_STREAM_DONE = object()
+
 async def async_fetch_users():
     """
     Asynchronously fetch all users from the database.
@@ -27,6 +30,59 @@ async def async_fetch_users():
         print(f"[ASYNC_FETCH_USERS] Error: {e}")
         return []
 
+async def async_stream_users(batch_size=100, max_buffered_batches=2, database_path='users.db'):
+    """
+    Asynchronously stream users from the database in batches.
+
+    A background task fetches batches into a bounded queue. When the
+    consumer falls behind, the queue fills up and the fetch pauses until
+    a batch is taken, so at most `max_buffered_batches` batches are held
+    in memory. Cancelling the consumer (including an `asyncio.timeout`
+    deadline) or closing the generator stops the fetch and closes the
+    connection.
+
+    Args:
+        batch_size (int): Number of rows fetched per batch
+        max_buffered_batches (int): Batches fetched ahead of the consumer
+        database_path (str): Path to the SQLite database file
+
+    Yields:
+        list: A batch of user records from the users table
+    """
+    queue = asyncio.Queue(maxsize=max_buffered_batches)
+
+    async def produce():
+        try:
+            async with aiosqlite.connect(database_path) as db:
+                async with db.execute("SELECT * FROM users") as cursor:
+                    while True:
+                        rows = await cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        await queue.put(rows)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(_STREAM_DONE)
+        finally:
+            print("[ASYNC_STREAM_USERS] Database connection closed")
+
+    print(f"[ASYNC_STREAM_USERS] Streaming users in batches of {batch_size}...")
+    producer = asyncio.create_task(produce())
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await producer
+
 async def async_fetch_older_users():
     """
     Asynchronously fetch users older than 40 from the database.
@@ -156,12 +212,38 @@ async def advanced_concurrent_example():
     except Exception as e:
         print(f"Error in advanced concurrent execution: {e}")
 
+async def streaming_example(deadline=5.0):
+    """
+    Demonstrate streaming users in batches with a slow consumer and a deadline.
+
+    Args:
+        deadline (float): Seconds allowed before the stream is cancelled
+    """
+    print("\n=== Streaming Example ===\n")
+    total = 0
+
+    try:
+        async with asyncio.timeout(deadline):
+            async with contextlib.aclosing(async_stream_users(batch_size=50)) as batches:
+                async for batch in batches:
+                    total += len(batch)
+                    print(f"[STREAMING] Processed batch of {len(batch)} users ({total} so far)")
+                    await asyncio.sleep(0.01)
+    except TimeoutError:
+        print(f"[STREAMING] Deadline of {deadline}s reached after {total} users")
+    except Exception as e:
+        print(f"[STREAMING] Error: {e}")
+
+    print(f"[STREAMING] Streamed {total} users")
+
 if __name__ == "__main__":
     print("Starting Asyncio Database Operations Demo\n")
-    
+
     asyncio.run(fetch_concurrently())
-    
+
     asyncio.run(advanced_concurrent_example())
-    
+
+    asyncio.run(streaming_example())
+
     print("\n=== Demo Complete ===")
 
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Script to bootstrap the SQLite users table used by the context manager,
+async and decorator examples, create indexes for its hot queries and
+verify that none of those queries fall back to a full table scan
+"""
+
+import argparse
+import sqlite3
+import sys
+
+USERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        age INTEGER NOT NULL
+    )
+"""
+
+# Covering index: every column of users lives in it, so `SELECT *` by age
+# and age range counts are answered from the index without touching the table.
+# Lookups by id use the INTEGER PRIMARY KEY (rowid) and need no extra index.
+USERS_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_users_age ON users (age, name, email)",
+]
+
+# Registered hot queries: name -> (sql, sample parameters for EXPLAIN)
+HOT_QUERIES = {}
+
+
+def register_hot_query(name, query, params=()):
+    """
+    Register a query whose plan must never be a full table scan
+
+    Args:
+        name (str): Unique name used in verification reports
+        query (str): SQL query, using ? placeholders
+        params (tuple): Sample parameters used when explaining the query
+    """
+    HOT_QUERIES[name] = (query, tuple(params))
+
+
+register_hot_query("user_by_id", "SELECT * FROM users WHERE id = ?", (1,))
+register_hot_query("users_older_than", "SELECT * FROM users WHERE age > ?", (25,))
+register_hot_query(
+    "users_in_age_range",
+    "SELECT * FROM users WHERE age BETWEEN ? AND ?",
+    (20, 30)
+)
+register_hot_query(
+    "count_users_in_age_range",
+    "SELECT COUNT(*) FROM users WHERE age BETWEEN ? AND ?",
+    (20, 30)
+)
+
+
+def create_schema(connection):
+    """
+    Creates the users table and its indexes if they do not exist,
+    then refreshes the planner statistics
+
+    Args:
+        connection: SQLite database connection object
+    """
+    cursor = connection.cursor()
+    cursor.execute(USERS_TABLE)
+    for statement in USERS_INDEXES:
+        cursor.execute(statement)
+    cursor.execute("ANALYZE")
+    connection.commit()
+    print("Table 'users' and its indexes created or already exist")
+
+
+def explain(connection, query, params=()):
+    """
+    Get the query plan SQLite picks for a query
+
+    Args:
+        connection: SQLite database connection object
+        query (str): SQL query to explain
+        params (tuple): Parameters for the query
+
+    Returns:
+        list: The detail column of each EXPLAIN QUERY PLAN row
+    """
+    cursor = connection.execute(f"EXPLAIN QUERY PLAN {query}", params)
+    return [row[3] for row in cursor.fetchall()]
+
+
+def verify_query_plans(connection, queries=None):
+    """
+    Check every registered hot query for full scans
+
+    A plan step starting with SCAN reads the whole table (or a whole index),
+    while SEARCH steps use an index range or key lookup.
+
+    Args:
+        connection: SQLite database connection object
+        queries (dict): Queries to check, defaults to HOT_QUERIES
+
+    Returns:
+        list: (name, plan detail) tuples for each query doing a full scan
+    """
+    failures = []
+    for name, (query, params) in (queries or HOT_QUERIES).items():
+        for detail in explain(connection, query, params):
+            if detail.startswith("SCAN"):
+                failures.append((name, detail))
+    return failures
+
+
+def main():
+    """
+    Main function to bootstrap the schema and optionally verify query plans
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database", default="users.db", help="Path to the SQLite database file")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Fail if EXPLAIN QUERY PLAN shows a full scan for a hot query"
+    )
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    try:
+        create_schema(connection)
+
+        if args.verify:
+            failures = verify_query_plans(connection)
+            for name, detail in failures:
+                print(f"[QUERY PLAN] {name}: full scan ({detail})")
+            if failures:
+                sys.exit(1)
+            print(f"[QUERY PLAN] All {len(HOT_QUERIES)} hot queries use an index")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Benchmark runner for the user_data streaming generators.
+
+Measures throughput, per-batch latency (p50/p99) and peak RSS for
+stream_users, stream_users_in_batches, lazy_paginate and
+calculate_average_age, against the local PostgreSQL ALX_prodev database
+or an embedded SQLite stand-in, and compares two result files.
+
+Usage:
+    ./benchmark.py run --backend standin --rows 100K --output before.json
+    ./benchmark.py compare before.json after.json --threshold 0.10
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = [
+    ("stream_users", {}),
+    ("stream_users_in_batches", {"batch_size": 10}),
+    ("stream_users_in_batches", {"batch_size": 100}),
+    ("stream_users_in_batches", {"batch_size": 1000}),
+    ("lazy_paginate", {"page_size": 100, "depth": 1}),
+    ("lazy_paginate", {"page_size": 100, "depth": 10}),
+    ("lazy_paginate", {"page_size": 100, "depth": 100}),
+    ("calculate_average_age", {}),
+]
+
+
+class _StandInCursor:
+    """psycopg2-style cursor over SQLite, translating %s placeholders"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        return self._cursor.execute(query.replace("%s", "?"), params)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _StandInConnection:
+    """psycopg2-style connection backed by a SQLite database file"""
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path)
+
+    def cursor(self):
+        return _StandInCursor(self._connection.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def create_stand_in(path, rows, seed=42, chunk_size=50_000):
+    """
+    Create a SQLite user_data table filled with synthetic users
+
+    Args:
+        path (str): Path to the SQLite database file
+        rows (int): Number of users to generate
+        seed (int): Seed passed to the synthetic data generator
+        chunk_size (int): Users generated per insert batch
+    """
+    from generate_users import generate_chunk
+
+    connection = sqlite3.connect(path)
+    connection.execute("DROP TABLE IF EXISTS user_data")
+    connection.execute("""
+        CREATE TABLE user_data (
+            user_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            age INTEGER NOT NULL
+        )
+    """)
+    for start in range(0, rows, chunk_size):
+        chunk = generate_chunk(seed, start, min(chunk_size, rows - start))
+        connection.executemany(
+            "INSERT INTO user_data (user_id, name, email, age) VALUES (?, ?, ?, ?)",
+            (row[1:] for row in chunk)
+        )
+    connection.commit()
+    connection.close()
+
+
+def install_stand_in(path):
+    """
+    Route every psycopg2.connect call to the SQLite stand-in database
+
+    Args:
+        path (str): Path to the SQLite database file
+    """
+    import psycopg2
+
+    psycopg2.connect = lambda *args, **kwargs: _StandInConnection(path)
+
+
+def load_module(filename):
+    """
+    Import one of the numbered exercise modules by file name
+
+    Args:
+        filename (str): File name inside this directory, e.g. 0-stream_users.py
+
+    Returns:
+        module: The imported module
+    """
+    name = filename[:-3].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of a list of samples
+
+    Args:
+        samples (list): Measured values
+        pct (float): Percentile between 0 and 100
+
+    Returns:
+        float: The percentile value, or 0.0 for no samples
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def _time_iterator(iterator, rows_in, limit=None):
+    """
+    Consume an iterator, timing the gap before each item
+
+    Args:
+        iterator: Generator under test
+        rows_in (callable): Returns the number of rows in one item
+        limit (int): Stop after this many items
+
+    Returns:
+        tuple: (latencies in seconds, total rows, elapsed seconds)
+    """
+    latencies = []
+    rows = 0
+    start = last = time.perf_counter()
+    for item in iterator:
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+        rows += rows_in(item)
+        if limit is not None and len(latencies) >= limit:
+            break
+    iterator.close()
+    return latencies, rows, time.perf_counter() - start
+
+
+def _bench_stream_users():
+    module = load_module("0-stream_users.py")
+    return _time_iterator(module.stream_users(), lambda row: 1)
+
+
+def _bench_stream_users_in_batches(batch_size):
+    module = load_module("1-batch_processing.py")
+    return _time_iterator(module.stream_users_in_batches(batch_size), len)
+
+
+def _bench_lazy_paginate(page_size, depth):
+    module = load_module("2-lazy_paginate.py")
+    return _time_iterator(module.lazy_paginate(page_size), len, limit=depth)
+
+
+def _bench_calculate_average_age():
+    module = load_module("4-stream_ages.py")
+    start = time.perf_counter()
+    module.calculate_average_age()
+    elapsed = time.perf_counter() - start
+    rows = sum(1 for _ in module.stream_user_ages())
+    return [elapsed], rows, elapsed
+
+
+BENCHMARKS = {
+    "stream_users": _bench_stream_users,
+    "stream_users_in_batches": _bench_stream_users_in_batches,
+    "lazy_paginate": _bench_lazy_paginate,
+    "calculate_average_age": _bench_calculate_average_age,
+}
+
+
+def scenario_key(name, params):
+    """Stable result key for a scenario, e.g. lazy_paginate[depth=10,page_size=100]"""
+    if not params:
+        return name
+    args = ",".join(f"{key}={value}" for key, value in sorted(params.items()))
+    return f"{name}[{args}]"
+
+
+def run_scenario(name, params, backend, stand_in_path):
+    """
+    Run one scenario; called in a fresh process so peak RSS is its own
+
+    Returns:
+        dict: Measured metrics for the scenario
+    """
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    if backend == "standin":
+        install_stand_in(stand_in_path)
+
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        latencies, rows, elapsed = BENCHMARKS[name](**params)
+
+    return {
+        "rows": rows,
+        "batches": len(latencies),
+        "seconds": elapsed,
+        "throughput_rows_per_s": rows / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run(args):
+    """Run every scenario and write the results to a JSON file"""
+    from generate_users import parse_row_count
+
+    stand_in_path = None
+    workdir = tempfile.TemporaryDirectory()
+    if args.backend == "standin":
+        stand_in_path = os.path.join(workdir.name, "user_data.db")
+        create_stand_in(stand_in_path, parse_row_count(args.rows), seed=args.seed)
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    try:
+        for name, params in SCENARIOS:
+            key = scenario_key(name, params)
+            if args.only and not any(pattern in key for pattern in args.only):
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                results[key] = pool.submit(
+                    run_scenario, name, params, args.backend, stand_in_path
+                ).result()
+            metrics = results[key]
+            print(
+                f"{key:<50} {metrics['throughput_rows_per_s']:>12.0f} rows/s "
+                f"p50={metrics['p50_ms']:.3f}ms p99={metrics['p99_ms']:.3f}ms "
+                f"rss={metrics['peak_rss_kb']}KB"
+            )
+    finally:
+        workdir.cleanup()
+
+    report = {
+        "meta": {
+            "backend": args.backend,
+            "rows": args.rows if args.backend == "standin" else None,
+            "python": platform.python_version(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {args.output}")
+
+
+# Metric name -> True when a larger value is better
+COMPARED_METRICS = {
+    "throughput_rows_per_s": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_kb": False,
+}
+
+
+def compare_reports(baseline, current, threshold):
+    """
+    Find metrics that got worse by more than the threshold
+
+    Args:
+        baseline (dict): Earlier benchmark report
+        current (dict): Later benchmark report
+        threshold (float): Allowed relative change, e.g. 0.10 for 10%
+
+    Returns:
+        list: (scenario, metric, baseline value, current value) regressions
+    """
+    regressions = []
+    for key, before in baseline["results"].items():
+        after = current["results"].get(key)
+        if after is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = before[metric], after[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append((key, metric, old, new))
+    return regressions
+
+
+def compare(args):
+    """Compare two result files and exit non-zero on regressions"""
+    with open(args.baseline) as baseline_file, open(args.current) as current_file:
+        baseline, current = json.load(baseline_file), json.load(current_file)
+
+    regressions = compare_reports(baseline, current, args.threshold)
+    for key, metric, old, new in regressions:
+        print(f"REGRESSION {key} {metric}: {old:.3f} -> {new:.3f}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions above {args.threshold:.0%}")
+
+
+def main():
+    """
+    Main function to parse arguments and run or compare benchmarks
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the user_data streaming generators")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--backend", choices=["standin", "postgres"], default="standin")
+    run_parser.add_argument("--rows", default="10K", help="Stand-in size, e.g. 1K, 1M or 10M")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--only", nargs="*", help="Only run scenarios whose key contains one of these")
+    run_parser.add_argument("--output", default="benchmark.json")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="Flag regressions between two runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
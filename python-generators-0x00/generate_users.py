@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Script to generate deterministic synthetic users at scale and load them
+into the PostgreSQL user_data table or the SQLite users table
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import sqlite3
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael",
+    "Linda", "David", "Elizabeth", "William", "Barbara", "Richard", "Susan",
+    "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen", "Amara",
+    "Chidi", "Thandiwe", "Kwame", "Aisha", "Mohamed", "Fatima", "Wei",
+    "Mei", "Hiroshi", "Yuki", "Carlos", "Lucia", "Mateo", "Sofia", "Ivan",
+    "Olga", "Arjun", "Priya", "Noah",
+]
+
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller",
+    "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Wilson",
+    "Anderson", "Taylor", "Moore", "Okafor", "Mensah", "Nkosi", "Dlamini",
+    "Mwangi", "Haddad", "Nguyen", "Chen", "Wang", "Tanaka", "Kim", "Singh",
+    "Patel", "Ivanov", "Rossi", "Muller", "Dubois", "Silva", "Kowalski",
+]
+
+# Email domains with their relative weights
+EMAIL_DOMAINS = [
+    ("gmail.com", 45),
+    ("yahoo.com", 15),
+    ("hotmail.com", 12),
+    ("outlook.com", 10),
+    ("icloud.com", 6),
+    ("aol.com", 2),
+    ("protonmail.com", 2),
+    ("example.org", 8),
+]
+
+# Age bands with their relative weights, skewed towards working-age adults
+AGE_BANDS = [
+    ((13, 17), 4),
+    ((18, 24), 16),
+    ((25, 34), 24),
+    ((35, 44), 20),
+    ((45, 54), 15),
+    ((55, 64), 11),
+    ((65, 79), 8),
+    ((80, 100), 2),
+]
+
+SIZE_SUFFIXES = {"K": 1_000, "M": 1_000_000}
+
+
+def parse_row_count(value):
+    """
+    Parse a row count such as 1000, 1K, 1M or 10M
+
+    Args:
+        value (str): Row count, optionally with a K or M suffix
+
+    Returns:
+        int: Number of rows
+    """
+    value = value.strip().upper()
+    if value and value[-1] in SIZE_SUFFIXES:
+        return int(float(value[:-1]) * SIZE_SUFFIXES[value[-1]])
+    return int(value)
+
+
+def generate_chunk(seed, start, count):
+    """
+    Generate a chunk of users
+
+    Each chunk has its own random generator derived from the seed and its
+    start offset, so the output is the same whatever the chunk order or
+    number of worker processes.
+
+    Args:
+        seed (int): Base seed for the whole data set
+        start (int): Index of the first user in the chunk
+        count (int): Number of users to generate
+
+    Returns:
+        list: Tuples of (index, user_id, name, email, age)
+    """
+    rng = random.Random(f"{seed}:{start}")
+    domains, domain_weights = zip(*EMAIL_DOMAINS)
+    bands, band_weights = zip(*AGE_BANDS)
+
+    rows = []
+    for index in range(start, start + count):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        separator = rng.choice([".", "_", ""])
+        domain = rng.choices(domains, domain_weights)[0]
+        low, high = rng.choices(bands, band_weights)[0]
+
+        user_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+        email = f"{first}{separator}{last}{index}@{domain}"
+        rows.append((index, str(user_id), f"{first} {last}", email, rng.randint(low, high)))
+
+    return rows
+
+
+def _chunk_bounds(total, chunk_size):
+    """Yield (start, count) for every chunk of the data set"""
+    for start in range(0, total, chunk_size):
+        yield start, min(chunk_size, total - start)
+
+
+def _bounded_map(pool, fn, tasks, window):
+    """
+    Like pool.map, but keep at most `window` tasks in flight so finished
+    chunks never pile up in memory ahead of the writer
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(fn, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _copy_chunk_to_postgres(args):
+    """
+    Generate one chunk and load it into user_data on its own connection
+
+    Rows are COPYed into a temporary staging table and moved over with
+    ON CONFLICT DO NOTHING, so rerunning with the same seed skips the
+    users already loaded instead of failing on their primary keys.
+
+    Args:
+        args (tuple): (seed, start, count)
+
+    Returns:
+        int: Number of rows inserted
+    """
+    from seed import connect_to_prodev
+
+    seed, start, count = args
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for _, user_id, name, email, age in generate_chunk(seed, start, count):
+        writer.writerow((user_id, name, email, age))
+    buffer.seek(0)
+
+    connection = connect_to_prodev(verbose=False)
+    if not connection:
+        raise ConnectionError("Could not connect to the ALX_prodev database")
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "CREATE TEMP TABLE user_data_stage (LIKE user_data INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            "COPY user_data_stage (user_id, name, email, age) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        cursor.execute("""
+            INSERT INTO user_data (user_id, name, email, age)
+            SELECT user_id, name, email, age FROM user_data_stage
+            ON CONFLICT (user_id) DO NOTHING
+        """)
+        inserted = cursor.rowcount
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    return inserted
+
+
+def load_postgres(total, seed, chunk_size, workers, **options):
+    """
+    Load users into the PostgreSQL user_data table with parallel COPY
+
+    The database and table are created first, once, so the worker
+    processes only ever connect to them.
+
+    Args:
+        total (int): Number of users to generate
+        seed (int): Base seed for the data set
+        chunk_size (int): Users generated and copied per task
+        workers (int): Number of worker processes
+    """
+    from seed import connect_to_postgres, connect_to_prodev, create_database, create_table
+
+    server = connect_to_postgres()
+    if not server:
+        raise ConnectionError("Could not connect to the PostgreSQL server")
+    create_database(server)
+    server.close()
+
+    connection = connect_to_prodev()
+    if not connection:
+        raise ConnectionError("Could not connect to the ALX_prodev database")
+    create_table(connection)
+    connection.close()
+
+    workers = workers or os.cpu_count()
+    tasks = ((seed, start, count) for start, count in _chunk_bounds(total, chunk_size))
+    generated = 0
+    inserted = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunks = _bounded_map(pool, _copy_chunk_to_postgres, tasks, workers * 2)
+        for (_, count), chunk_inserted in zip(_chunk_bounds(total, chunk_size), chunks):
+            generated += count
+            inserted += chunk_inserted
+            print(f"Loaded {generated}/{total} users into user_data ({inserted} new)")
+
+
+def _generate_chunk_task(args):
+    """Process pool entry point for generate_chunk"""
+    return generate_chunk(*args)
+
+
+def load_sqlite(total, seed, chunk_size, workers, sqlite_path="users.db", **options):
+    """
+    Load users into the SQLite users table
+
+    Chunks are generated in parallel worker processes. SQLite allows a single
+    writer, so the main process inserts each chunk with executemany.
+    Indexes are left to users_schema.py, which is cheaper to run once the
+    table is loaded.
+
+    Args:
+        total (int): Number of users to generate
+        seed (int): Base seed for the data set
+        chunk_size (int): Users generated and inserted per task
+        workers (int): Number of worker processes
+        sqlite_path (str): Path to the SQLite database file
+    """
+    connection = sqlite3.connect(sqlite_path)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            age INTEGER NOT NULL
+        )
+    """)
+
+    workers = workers or os.cpu_count()
+    tasks = ((seed, start, count) for start, count in _chunk_bounds(total, chunk_size))
+    loaded = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rows in _bounded_map(pool, _generate_chunk_task, tasks, workers * 2):
+                connection.executemany(
+                    "INSERT OR REPLACE INTO users (id, name, email, age) VALUES (?, ?, ?, ?)",
+                    ((index + 1, name, email, age) for index, _, name, email, age in rows)
+                )
+                connection.commit()
+                loaded += len(rows)
+                print(f"Inserted {loaded}/{total} users into {sqlite_path}")
+    finally:
+        connection.close()
+
+
+WRITERS = {
+    "postgres": load_postgres,
+    "sqlite": load_sqlite,
+}
+
+
+def main():
+    """
+    Main function to generate users and load them into the chosen target
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", default="1K", help="Number of users, e.g. 1K, 1M or 10M")
+    parser.add_argument("--target", choices=sorted(WRITERS), default="postgres")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--sqlite-path", default="users.db")
+    args = parser.parse_args()
+
+    total = parse_row_count(args.rows)
+    start_time = time.time()
+    WRITERS[args.target](
+        total,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        sqlite_path=args.sqlite_path
+    )
+    print(f"Generated {total} users in {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
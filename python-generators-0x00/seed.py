@@ -63,10 +63,13 @@ def create_database(connection):
         print(f"Error creating database: {e}")
 
 
-def connect_to_prodev():
+def connect_to_prodev(verbose=True):
     """
     Connects to the ALX_prodev database in PostgreSQL
     
+    Args:
+        verbose (bool): Print a message once connected
+
     Returns:
         connection: PostgreSQL database connection to ALX_prodev
     """
@@ -78,7 +81,8 @@ def connect_to_prodev():
             port="5432",       
             database="alx_prodev"
         )
-        print("Successfully connected to ALX_prodev database")
+        if verbose:
+            print("Successfully connected to ALX_prodev database")
         return connection
     except Error as e:
         print(f"Error connecting to ALX_prodev database: {e}")